@@ -0,0 +1,505 @@
+"""
+This script deploys the services defined in a config file: for each one it
+pulls the repository and builds a docker image, running it when complete. If
+there is already a running version, it will be taken down and replaced with
+the newly built image.
+
+Services are deployed concurrently by a bounded pool of workers, so deploying
+several takes about as long as the slowest one. Every output line is prefixed
+with the name of the service it belongs to.
+
+A build cache file (default: deploy-cache.json) records what every service was
+last deployed from: the commit and a hash of the build context. When neither
+changed and the container still runs that image, the build and restart are
+skipped. Otherwise the previous image is the --cache-from of the new build.
+
+The config file (default: services.json next to this script) is JSON with a
+"services" list. Each service has:
+
+    name           Name used in the log and the defaults below (required)
+    repo_dir       Repository to pull and build (required)
+    image          Base name of the image (default: name)
+    container      Name of the container (default: name)
+    branch         Branch to pull (default: master)
+    build_nr_file  File that stores the build number (default: <name>-build-nr.txt)
+    ports          List of docker run -p mappings; two services can't publish
+                   the same host port
+    env            Names of environment variables passed on to the container
+    build_options  Extra docker build options
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services.json')
+DEFAULT_CACHE = 'deploy-cache.json'
+VERSION = '0.0.1' # Fallback version in case build-nr file does not exist
+
+# Keeps the lines of concurrent deploys whole
+print_lock = threading.Lock()
+
+class DeployError(Exception):
+    pass
+
+def dockerignore_patterns(directory):
+    """
+    The .dockerignore patterns of the build context in directory, as lists
+    of path components. Patterns this can't match exactly like docker (with
+    ** or ! exceptions) are left out, so at worst more files are hashed.
+    """
+    try:
+        with open(os.path.join(directory, '.dockerignore'), 'r') as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    patterns = [line for line in lines if line and not line.startswith('#')]
+    if any(pattern.startswith('!') for pattern in patterns):
+        return []
+    return [os.path.normpath(pattern.strip('/')).split(os.sep) for pattern in patterns if '**' not in pattern]
+
+def is_ignored(parts, patterns):
+    # Like docker, * doesn't match across directories
+    return any(len(pattern) == len(parts) and all(map(fnmatch.fnmatchcase, parts, pattern))
+               for pattern in patterns)
+
+def context_hash(directory):
+    """sha256 of the paths and contents of the files of the build context in directory, but .git and .dockerignore'd ones."""
+    patterns = dockerignore_patterns(directory)
+    digest = hashlib.sha256()
+    for path, dirs, files in os.walk(directory):
+        relative = os.path.relpath(path, directory)
+        parts = [] if relative == '.' else relative.split(os.sep)
+        dirs[:] = sorted(name for name in dirs
+                         if not (not parts and name == '.git') and not is_ignored(parts + [name], patterns))
+        for name in sorted(files):
+            if is_ignored(parts + [name], patterns):
+                continue
+            file_path = os.path.join(path, name)
+            digest.update(os.path.join(relative, name).encode('utf-8', 'surrogateescape') + b'\0')
+            if os.path.islink(file_path):
+                digest.update(b'link\0' + os.readlink(file_path).encode('utf-8', 'surrogateescape'))
+            else:
+                with open(file_path, 'rb') as f:
+                    while chunk := f.read(1 << 20):
+                        digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+class BuildCache:
+    """
+    The inputs (commit, context hash, build options) and image of the last
+    deploy of every service, in a JSON file shared by concurrent deploys.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            raise DeployError(f"can't read {path}: {e}") from None
+
+    def get(self, name):
+        with self.lock:
+            return self.entries.get(name)
+
+    def put(self, name, entry):
+        with self.lock:
+            self.entries[name] = entry
+            # Replaced in one go so an interrupted write can't leave half a file
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(temp_path, self.path)
+
+class Service:
+    """A service of the config file, and the steps that deploy it."""
+    def __init__(self, config, dry_run=False):
+        try:
+            self.name = config['name']
+            self.repo_dir = config['repo_dir']
+        except KeyError as e:
+            raise DeployError(f"service {config.get('name', '?')} has no {e.args[0]}") from None
+        self.image = config.get('image', self.name)
+        self.container = config.get('container', self.name)
+        self.branch = config.get('branch', 'master')
+        self.build_nr_file = config.get('build_nr_file', f"{self.name}-build-nr.txt")
+        self.ports = config.get('ports', [])
+        self.env = config.get('env', [])
+        self.build_options = config.get('build_options', [])
+        self.dry_run = dry_run
+        self.unchanged = False
+
+    def log(self, message):
+        with print_lock:
+            print(f"[{self.name}] {message}", flush=True)
+
+    def run_command(self, command, cwd=None):
+        """Run a command, printing its output prefixed with the service name as it comes. Returns the exit code."""
+        self.log(f"Executing: {subprocess.list2cmdline(command)}")
+        if self.dry_run:
+            return 0
+        with subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) as process:
+            for line in process.stdout:
+                self.log(line.rstrip("\n"))
+            return_code = process.wait()
+        if return_code != 0:
+            self.log(f"Error: Command exited with code {return_code}")
+        return return_code
+
+    def check_command(self, command, cwd=None):
+        """Run a command the deploy can't go on without."""
+        return_code = self.run_command(command, cwd)
+        if return_code != 0:
+            raise DeployError(f"{command[0]} {command[1]} exited with code {return_code}")
+
+    def capture_command(self, command, cwd=None):
+        """Run a command for its output, returned stripped, or None if it fails (or on a dry run)."""
+        self.log(f"Executing: {subprocess.list2cmdline(command)}")
+        if self.dry_run:
+            return None
+        result = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def pull_from_git(self):
+        self.log("Pulling the latest changes from Git...")
+        self.check_command(["git", "pull", "origin", self.branch], cwd=self.repo_dir)
+
+    def build_inputs(self):
+        """What the image is built from, or None if it isn't known."""
+        commit = self.capture_command(["git", "rev-parse", "HEAD"], cwd=self.repo_dir)
+        if commit is None:
+            return None
+        return {"commit": commit, "context": context_hash(self.repo_dir), "build_options": self.build_options}
+
+    def running_image(self):
+        """The image of the container, or None if there is none."""
+        return self.capture_command(["docker", "inspect", "-f", "{{.Config.Image}}", self.container])
+
+    def build_docker_image(self, image_name, cache_from=None):
+        self.log("Building the Docker image...")
+        # Inline cache metadata lets the next build reuse this image's layers with --cache-from
+        options = ["--build-arg", "BUILDKIT_INLINE_CACHE=1"]
+        if cache_from is not None:
+            options += ["--cache-from", cache_from]
+        self.check_command(["docker", "build", *self.build_options, *options, "-t", image_name, self.repo_dir])
+
+    def stop_and_remove_container(self):
+        # Failures are fine here, there may be no container yet
+        self.log(f"Stopping the running container '{self.container}' (if it exists)...")
+        self.run_command(["docker", "stop", self.container], cwd=self.repo_dir)
+
+        self.log(f"Removing the stopped container '{self.container}' (if it exists)...")
+        self.run_command(["docker", "rm", self.container], cwd=self.repo_dir)
+
+    def start_new_container(self, image_name):
+        self.log(f"Starting a new container '{self.container}' with the image '{image_name}'...")
+        options = []
+        for port in self.ports:
+            options += ["-p", port]
+        for name in self.env:
+            # Without a value docker takes it from this environment
+            options += ["-e", name]
+        self.check_command(["docker", "run", "-d", *options, "--name", self.container, image_name])
+
+    def read_version(self):
+        """Read the current version number from the build-nr file."""
+        if os.path.exists(self.build_nr_file):
+            with open(self.build_nr_file, 'r') as f:
+                return f.read().strip()
+        return VERSION
+
+    def write_version(self, version):
+        """Write the new version number to the build-nr file."""
+        if self.dry_run:
+            return
+        with open(self.build_nr_file, 'w') as f:
+            f.write(str(version))
+
+    def next_version(self):
+        """Increment the patch number of the version in the build-nr file and return it."""
+        version = self.read_version()
+        version_params = version.split('.')
+        try:
+            version_params[2] = int(version_params[2]) + 1
+        except (IndexError, ValueError):
+            raise DeployError(f"{self.build_nr_file} holds {version!r}, not a version like {VERSION}") from None
+        version = '.'.join(str(i) for i in version_params)
+        self.write_version(version)
+        return version
+
+    def deploy(self, cache=None, force=False):
+        """
+        Deploy the service, returning the name of the image it runs. With a
+        BuildCache, nothing is built or restarted when the inputs are the
+        same as those of the running image, unless force is set.
+        """
+        self.log("Starting the deployment process...")
+        self.pull_from_git()
+
+        previous = cache.get(self.name) if cache is not None else None
+        inputs = self.build_inputs() if cache is not None else None
+        if not force and inputs is not None and previous is not None and \
+                previous['inputs'] == inputs and self.running_image() == previous['image']:
+            self.log(f"Unchanged since commit {inputs['commit'][:12]}, skipping the build and restart of {previous['image']}")
+            self.unchanged = True
+            return previous['image']
+
+        version = self.next_version()
+
+        # Create the image name with the version number
+        image_name = f"{self.image}:v{version}"
+
+        self.build_docker_image(image_name, previous['image'] if previous is not None else None)
+        self.stop_and_remove_container()
+        self.start_new_container(image_name)
+        if inputs is not None:
+            cache.put(self.name, {"inputs": inputs, "image": image_name})
+
+        self.log(f"Deployment completed successfully with image: {image_name}")
+        return image_name
+
+def host_ports(mapping):
+    """
+    The (host address, port, protocol) a docker run -p mapping publishes,
+    none when docker picks the host port. '' stands for every address.
+    """
+    mapping, _, protocol = mapping.partition('/')
+    parts = mapping.rsplit(':', 2)
+    if len(parts) == 1 or not parts[-2]:
+        return []
+    address = parts[0] if len(parts) == 3 else ''
+    if address == '0.0.0.0':
+        address = ''
+    first, _, last = parts[-2].partition('-')
+    return [(address, port, protocol or 'tcp') for port in range(int(first), int(last or first) + 1)]
+
+def check_ports(services):
+    """Raise DeployError if two services publish the same host port: their containers couldn't both run."""
+    published = {}
+    for service in services:
+        for mapping in service.ports:
+            try:
+                ports = host_ports(mapping)
+            except ValueError:
+                raise DeployError(f"service {service.name} has an invalid port mapping {mapping!r}") from None
+            for address, port, protocol in ports:
+                for other_address, other in published.get((port, protocol), []):
+                    if other != service.name and (not address or not other_address or address == other_address):
+                        raise DeployError(f"services {other} and {service.name} both publish host port {port}/{protocol}")
+                published.setdefault((port, protocol), []).append((address, service.name))
+
+def load_services(path, names=None, dry_run=False):
+    """Read the services of the config file at path, only those in names if given."""
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise DeployError(f"can't read {path}: {e}") from None
+    services = [Service(service, dry_run) for service in config.get('services', [])]
+    # All of them, the ones not deployed now are still running
+    check_ports(services)
+    if names:
+        known = {service.name for service in services}
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise DeployError(f"unknown services: {', '.join(unknown)}")
+        services = [service for service in services if service.name in names]
+    return services
+
+def deploy_services(services, jobs=None, cache=None, force=False):
+    """
+    Deploy services concurrently, at most jobs at a time (default: all),
+    see Service.deploy for cache and force.
+    Returns {name: (image name or DeployError, seconds)}.
+    """
+    def timed_deploy(service):
+        started = time.perf_counter()
+        try:
+            result = service.deploy(cache, force)
+        except Exception as e:
+            # One broken service mustn't take the others' summary down
+            service.log(f"Deployment failed: {e}")
+            result = e if isinstance(e, DeployError) else DeployError(f"{type(e).__name__}: {e}")
+        return result, time.perf_counter() - started
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or max(len(services), 1)) as executor:
+        futures = {executor.submit(timed_deploy, service): service for service in services}
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future].name] = future.result()
+    return results
+
+def run_tests():
+    """Run some basic tests of the build cache and the config checks."""
+    print("Running tests...\n")
+
+    all_tests_passed = True
+
+    def check(description, ok):
+        nonlocal all_tests_passed, passed
+        if ok:
+            print(f"  ✓ {description}")
+        else:
+            print(f"  ERROR: {description}")
+            passed = all_tests_passed = False
+
+    def report(number):
+        print(f"\nTEST {number}: {'PASSED' if passed else 'FAILED'}")
+
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    test_dir = tempfile.mkdtemp(prefix="deploy_test_")
+    try:
+        # Test 1: .dockerignore patterns
+        print("TEST 1: .dockerignore patterns are split into path components")
+        print("--------------------------------------------------------------")
+        passed = True
+        context = os.path.join(test_dir, "context")
+        write(os.path.join(context, ".dockerignore"), "# comment\n\n/build/\n*.log\ndocs/*.md\n**/tmp\n")
+        check("comments, blank lines and ** patterns left out, the rest split",
+              dockerignore_patterns(context) == [["build"], ["*.log"], ["docs", "*.md"]])
+        exceptions = os.path.join(test_dir, "exceptions")
+        write(os.path.join(exceptions, ".dockerignore"), "*.log\n!keep.log\n")
+        check("nothing ignored when there are ! exceptions", dockerignore_patterns(exceptions) == [])
+        check("nothing ignored without a .dockerignore", dockerignore_patterns(test_dir) == [])
+        check("* doesn't match across directories",
+              is_ignored(["a.log"], [["*.log"]]) and not is_ignored(["src", "a.log"], [["*.log"]]))
+        report(1)
+
+        # Test 2: Build context hashes
+        print("\n\nTEST 2: The context hash only changes with the files docker would see")
+        print("---------------------------------------------------------------------")
+        passed = True
+        for name in ("Dockerfile", "src/main.py", "build/out.bin", "app.log", "docs/index.md", "docs/img/a.md",
+                     ".git/HEAD"):
+            write(os.path.join(context, name), name)
+        first = context_hash(context)
+        check("the same tree hashes the same", context_hash(context) == first)
+        for name in ("build/out.bin", "app.log", "docs/index.md", ".git/HEAD"):
+            write(os.path.join(context, name), "changed")
+        check("changes to ignored files and .git don't change it", context_hash(context) == first)
+        write(os.path.join(context, "docs/img/a.md"), "changed")
+        second = context_hash(context)
+        check("a change below an ignored pattern's depth changes it", second != first)
+        os.rename(os.path.join(context, "src/main.py"), os.path.join(context, "src/other.py"))
+        check("a renamed file changes it", context_hash(context) != second)
+        report(2)
+
+        # Test 3: The build cache file
+        print("\n\nTEST 3: The build cache is kept across runs and written whole")
+        print("------------------------------------------------------------")
+        passed = True
+        cache_path = os.path.join(test_dir, "cache.json")
+        cache = BuildCache(cache_path)
+        check("a missing file is an empty cache", cache.get("odin") is None)
+        entry = {"inputs": {"commit": "abc", "context": first, "build_options": []}, "image": "odin:v0.0.2"}
+        cache.put("odin", entry)
+        check("entries are read back by the next run", BuildCache(cache_path).get("odin") == entry)
+        check("no temporary file is left behind", os.listdir(test_dir).count("cache.json.tmp") == 0)
+        write(cache_path, "{not json")
+        try:
+            BuildCache(cache_path)
+            check("a malformed file raises DeployError", False)
+        except DeployError:
+            check("a malformed file raises DeployError", True)
+        report(3)
+
+        # Test 4: Host ports
+        print("\n\nTEST 4: Two services can't publish the same host port")
+        print("-----------------------------------------------------")
+        passed = True
+
+        def clashes(*ports):
+            services = [Service({"name": f"s{i}", "repo_dir": test_dir, "ports": mappings})
+                        for i, mappings in enumerate(ports)]
+            try:
+                check_ports(services)
+                return False
+            except DeployError:
+                return True
+
+        check("the same host port clashes", clashes(["8014:8080"], ["8014:8080"]))
+        check("different host ports don't", not clashes(["8014:8080"], ["8015:8080"]))
+        check("one address and all of them clash", clashes(["127.0.0.1:8014:8080"], ["8014:80"]))
+        check("two different addresses don't", not clashes(["127.0.0.1:8014:80"], ["10.0.0.1:8014:80"]))
+        check("tcp and udp don't", not clashes(["8014:8080"], ["8014:8080/udp"]))
+        check("ports docker picks don't", not clashes(["8080"], ["8080", "127.0.0.1::8080"]))
+        check("ranges overlap", clashes(["8010-8020:8010-8020"], ["8014:8080"]))
+        try:
+            load_services(DEFAULT_CONFIG)
+            check(f"the services of {os.path.basename(DEFAULT_CONFIG)} load without clashes", True)
+        except DeployError as e:
+            check(f"the services of {os.path.basename(DEFAULT_CONFIG)} load without clashes ({e})", False)
+        report(4)
+    finally:
+        shutil.rmtree(test_dir)
+
+    # Summary
+    print("\n======================")
+    if all_tests_passed:
+        print("All tests PASSED!")
+    else:
+        print("Some tests FAILED!")
+    print("======================")
+
+    return all_tests_passed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pull, build and (re)start the services of a config file, concurrently.")
+    parser.add_argument("services", nargs="*", help="Services to deploy (default: all of the config file)")
+    parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help=f"Config file (default: {DEFAULT_CONFIG})")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Services deployed at the same time (default: all)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"Build cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the build cache")
+    parser.add_argument("-f", "--force", action="store_true", help="Build and restart even unchanged services")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Print the commands instead of running them")
+    parser.add_argument("--test", action="store_true", help="Run the built-in tests")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    if args.test:
+        sys.exit(0 if run_tests() else 1)
+    try:
+        services = load_services(args.config, args.services, args.dry_run)
+        cache = None if args.no_cache else BuildCache(args.cache)
+    except DeployError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+
+    started = time.perf_counter()
+    results = deploy_services(services, args.jobs, cache, args.force)
+
+    print(f"Deployed {len(services)} services in {time.perf_counter() - started:.1f}s:")
+    failed = False
+    for service in services:
+        result, seconds = results[service.name]
+        if isinstance(result, DeployError):
+            failed = True
+            print(f"  {service.name:<20} FAILED ({result}) after {seconds:.1f}s")
+        else:
+            print(f"  {service.name:<20} {result} in {seconds:.1f}s{' (unchanged)' if service.unchanged else ''}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,193 +1,2206 @@
-import os
-import sys
-import concurrent.futures
-import multiprocessing
-import time
-import threading
-from collections import defaultdict
-
-# ANSI color codes
-YELLOW = "\033[33m"
-CYAN = "\033[36m"
-GREEN = "\033[32m"
-RED = "\033[31m"
-RESET = "\033[0m"
-
-def handle_long_path(path):
-    """Handle extremely long paths by using os.scandir instead of os.listdir"""
-    try:
-        # For Windows systems, try to use the extended-length path format
-        if sys.platform == 'win32' and not path.startswith('\\\\?\\'):
-            path = '\\\\?\\' + os.path.abspath(path)
-        return path
-    except Exception:
-        return path
-
-def get_file_size(fp):
-    try:
-        fp = handle_long_path(fp)
-        return os.path.getsize(fp) if os.path.isfile(fp) else 0
-    except (PermissionError, FileNotFoundError, OSError):
-        return 0
-
-def get_directory_size(path, progress_dict, lock):
-    path = handle_long_path(path)
-    total_size = 0
-    file_list = []
-    dir_list = []
-    
-    try:
-        with lock:
-            progress_dict[path] = {"status": "scanning", "message": "Scanning..."}
-        
-        with os.scandir(path) as scanner:
-            for entry in scanner:
-                try:
-                    if entry.is_file():
-                        file_list.append(entry.path)
-                    elif entry.is_dir():
-                        dir_list.append(entry.path)
-                except OSError:
-                    # Skip files/directories that cause OSError
-                    continue
-    except (PermissionError, OSError):
-        with lock:
-            progress_dict[path] = {"status": "error", "message": "Access Denied"}
-        return 0
-    
-    # Process files in current directory
-    total_files = len(file_list)
-    files_processed = 0
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(file_list) or 1)) as executor:
-        future_to_file = {executor.submit(get_file_size, fp): fp for fp in file_list}
-        for future in concurrent.futures.as_completed(future_to_file):
-            try:
-                size = future.result()
-                total_size += size
-                files_processed += 1
-                with lock:
-                    progress_dict[path] = {"status": "scanning", "message": f"Scanning... ({files_processed}/{total_files} files)"}
-            except Exception:
-                # Skip files that cause exceptions
-                files_processed += 1
-
-    # Recursively process subdirectories
-    for subdir in dir_list:
-        try:
-            subdir_size = get_directory_size(subdir, progress_dict, lock)
-            total_size += subdir_size
-        except (RecursionError, OSError):
-            # Skip directories that cause recursion errors or OSErrors
-            continue
-    
-    with lock:
-        progress_dict[path] = {"status": "complete", "message": format_size(total_size)}
-    
-    return total_size
-
-def format_size(size_in_bytes):
-    if size_in_bytes is None:
-        return "Access Denied"
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if size_in_bytes < 1024:
-            return f"{size_in_bytes:.2f} {unit}"
-        size_in_bytes /= 1024
-
-def colored_status(status_dict):
-    if status_dict is None:
-        return f"{YELLOW}Pending...{RESET}"
-    
-    status = status_dict.get("status", "pending")
-    message = status_dict.get("message", "Pending...")
-    
-    if status == "pending":
-        return f"{YELLOW}{message}{RESET}"
-    elif status == "scanning":
-        return f"{CYAN}{message}{RESET}"
-    elif status == "complete":
-        return f"{GREEN}{message}{RESET}"
-    elif status == "error":
-        return f"{RED}{message}{RESET}"
-    return message
-
-def display_progress(root_path, progress_dict):
-    sys.stdout.write("\033c")  # Clear console
-    print(f"Scanning: {root_path}")
-    print("Size calculation in progress...\n")
-    
-    try:
-        items = sorted(os.scandir(root_path), key=lambda x: x.name.lower())
-        for item in items:
-            if item.is_dir():
-                status = progress_dict.get(item.path)
-                colored_msg = colored_status(status)
-                print(f"|- ({colored_msg}) {item.name}")
-    except (PermissionError, OSError):
-        print(f"{RED}Access Denied to root directory{RESET}")
-
-def scan_directory(root_path):
-    root_path = handle_long_path(root_path)
-    sizes_dict = {}
-    progress_dict = {}
-    lock = threading.Lock()
-    
-    # Initialize all directories as pending
-    try:
-        with os.scandir(root_path) as scanner:
-            for entry in scanner:
-                if entry.is_dir():
-                    with lock:
-                        progress_dict[entry.path] = {"status": "pending", "message": "Pending..."}
-    except (PermissionError, OSError):
-        print(f"{RED}Error accessing the root directory{RESET}")
-        return
-    
-    def update_display():
-        while True:
-            with lock:
-                if '_scan_complete' in progress_dict:
-                    break
-                display_progress(root_path, progress_dict)
-            time.sleep(0.5)
-    
-    # Start display update thread
-    display_thread = threading.Thread(target=update_display)
-    display_thread.daemon = True
-    display_thread.start()
-    
-    # Perform the scan
-    try:
-        total_size = get_directory_size(root_path, progress_dict, lock)
-        sizes_dict[root_path] = total_size
-    except Exception as e:
-        print(f"{RED}Error during scan: {str(e)}{RESET}")
-        total_size = 0
-    
-    # Signal completion and show final results
-    with lock:
-        progress_dict['_scan_complete'] = True
-    display_thread.join(timeout=1)
-    
-    # Display final results
-    sys.stdout.write("\033c")
-    print(f"Complete scan results for: {root_path}")
-    print(f"Total size: {GREEN}{format_size(total_size)}{RESET}")
-    
-    try:
-        items = sorted(os.scandir(root_path), key=lambda x: x.name.lower())
-        for item in items:
-            if item.is_dir():
-                status = progress_dict.get(item.path)
-                colored_msg = colored_status(status)
-                print(f"|- ({colored_msg}) {item.name}")
-    except (PermissionError, OSError):
-        print(f"{RED}Access Denied to root directory{RESET}")
-
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        scan_path = sys.argv[1]
-    else:
-        scan_path = os.getcwd()
-    
-    scan_directory(scan_path)
\ No newline at end of file
+import argparse
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import itertools
+import heapq
+import io
+import json
+import os
+import shutil
+import queue
+import sqlite3
+import stat
+import subprocess
+import sys
+import tempfile
+import multiprocessing
+import time
+import threading
+import urllib.parse
+from collections import defaultdict
+
+# ANSI color codes
+YELLOW = "\033[33m"
+CYAN = "\033[36m"
+GREEN = "\033[32m"
+RED = "\033[31m"
+RESET = "\033[0m"
+
+def handle_long_path(path):
+    """Handle extremely long paths by using os.scandir instead of os.listdir"""
+    try:
+        # For Windows systems, try to use the extended-length path format
+        if sys.platform == 'win32' and not path.startswith('\\\\?\\'):
+            path = '\\\\?\\' + os.path.abspath(path)
+        return path
+    except Exception:
+        return path
+
+class DirNode:
+    """
+    A directory in the size tree built by DirectoryScanner.
+    
+    size and files cover the files directly inside the directory; total
+    covers the whole subtree and is only final once the directory is
+    complete. pending counts the directory's own listing plus its
+    unfinished subdirectories. mtime (st_mtime_ns) is only known when the
+    scan needed it, largest only when the scan kept the largest files and
+    entries only while a streamed export still needs them. links is set
+    when a file directly inside has several hard links.
+    """
+    __slots__ = ('name', 'parent', 'children', 'size', 'files', 'total', 'pending', 'error', 'mtime',
+                 'largest', 'entries', 'links')
+    
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.size = 0
+        self.files = 0
+        self.total = 0
+        self.pending = 1
+        self.error = None
+        self.mtime = None
+        # (size, name) of the largest files directly inside, largest first
+        self.largest = None
+        # (name, lstat result) of every file counted directly inside
+        self.entries = None
+        self.links = False
+    
+    def path(self):
+        parts = []
+        node = self
+        while node is not None:
+            parts.append(node.name)
+            node = node.parent
+        return os.path.join(*reversed(parts))
+
+class TopEntries:
+    """
+    The n largest files and directories of a scan. Every worker thread
+    keeps its own bounded min-heaps, so memory stays O(n) per thread no
+    matter how big the tree is and workers never wait on each other; the
+    heaps are only merged once the scan is done.
+    """
+    def __init__(self, n):
+        self.n = n
+        self._local = threading.local()
+        self._heaps = []
+    
+    def heaps(self):
+        """(files, directories) min-heaps of (size, path) of the calling thread."""
+        heaps = getattr(self._local, 'heaps', None)
+        if heaps is None:
+            heaps = self._local.heaps = ([], [])
+            self._heaps.append(heaps)
+        return heaps
+    
+    def files(self):
+        """(size, path) of the largest files, largest first."""
+        return heapq.nlargest(self.n, (entry for heaps in self._heaps for entry in heaps[0]))
+    
+    def directories(self):
+        """(total size, path) of the largest directories below the root, largest first."""
+        return heapq.nlargest(self.n, (entry for heaps in self._heaps for entry in heaps[1]))
+
+class Breakdown:
+    """
+    Totals of the files of a scan by extension, owner and age, taken from
+    the lstat results the scan has anyway, so they come in the same single
+    pass. Like TopEntries, every worker thread adds to tables of its own,
+    merged once the scan is done.
+    
+    Args:
+        fields: Any of FIELDS; mtime and atime bucket files by the age of
+            their last modification and access
+        now: Time (seconds since the epoch) ages are measured from
+    """
+    FIELDS = ("extension", "owner", "mtime", "atime")
+    # (age limit in seconds, label) of the age buckets, youngest first
+    AGES = ((86400, "< 1 day"), (7 * 86400, "< 1 week"), (30 * 86400, "< 30 days"),
+            (90 * 86400, "< 90 days"), (365 * 86400, "< 1 year"), (3 * 365 * 86400, "< 3 years"))
+    OLDEST = ">= 3 years"
+    
+    def __init__(self, fields, now=None):
+        self.fields = list(fields)
+        self.now = time.time() if now is None else now
+        self._local = threading.local()
+        self._tables = []
+    
+    def key_function(self, field):
+        """callable(name, st) giving the key of a file in the table of field."""
+        if field == "extension":
+            return lambda name, st: os.path.splitext(name)[1].lower()
+        if field == "owner":
+            return lambda name, st: st.st_uid
+        limits = [limit for limit, _ in self.AGES]
+        # Files timestamped in the future count as new
+        cutoffs = [self.now - limit for limit in limits]
+        cutoffs.reverse()
+        buckets = len(cutoffs)
+        attribute = "st_mtime" if field == "mtime" else "st_atime"
+        return lambda name, st: buckets - bisect.bisect_right(cutoffs, getattr(st, attribute))
+    
+    def tables(self):
+        """[(key function, {key: [size, files]})] of every field, for the calling thread."""
+        tables = getattr(self._local, 'tables', None)
+        if tables is None:
+            tables = self._local.tables = [(self.key_function(field), {}) for field in self.fields]
+            self._tables.append(tables)
+        return tables
+    
+    def totals(self, field):
+        """[(label, size, files)] of field over all threads, largest first (youngest first for ages)."""
+        index = self.fields.index(field)
+        merged = defaultdict(lambda: [0, 0])
+        for tables in self._tables:
+            for key, (size, files) in tables[index][1].items():
+                totals = merged[key]
+                totals[0] += size
+                totals[1] += files
+        if field in ("mtime", "atime"):
+            keys = sorted(merged)
+        else:
+            keys = sorted(merged, key=lambda key: (-merged[key][0], str(key)))
+        return [(self._label(field, key), *merged[key]) for key in keys]
+    
+    def _label(self, field, key):
+        if field == "extension":
+            return key or "(none)"
+        if field == "owner":
+            try:
+                import pwd
+                return pwd.getpwuid(key).pw_name
+            except (ImportError, KeyError):
+                return str(key)
+        return self.AGES[key][1] if key < len(self.AGES) else self.OLDEST
+
+def default_jobs():
+    # Listing and stat calls wait on I/O, so more threads than cores pay off
+    return min(32, (os.cpu_count() or 1) + 4)
+
+class LocalFileSystem:
+    """The file system calls a scanner makes, straight to the os module."""
+    scandir = staticmethod(os.scandir)
+    stat = staticmethod(os.stat)
+    lstat = staticmethod(os.lstat)
+
+class LatencyFileSystem:
+    """
+    Wraps a file system and sleeps before every call, to see how a scanner
+    copes with the per-call latency of NFS and other network mounts.
+    Entry types come with the listing, so only DirEntry.stat() sleeps.
+    """
+    def __init__(self, latency, fs=LocalFileSystem):
+        self.latency = latency
+        self.fs = fs
+    
+    def scandir(self, path):
+        time.sleep(self.latency)
+        with self.fs.scandir(path) as scanner:
+            return contextlib.nullcontext([_SlowEntry(entry, self.latency) for entry in scanner])
+    
+    def stat(self, path):
+        time.sleep(self.latency)
+        return self.fs.stat(path)
+    
+    def lstat(self, path):
+        time.sleep(self.latency)
+        return self.fs.lstat(path)
+
+class _SlowEntry:
+    __slots__ = ('entry', 'latency', 'name', 'path')
+    
+    def __init__(self, entry, latency):
+        self.entry = entry
+        self.latency = latency
+        self.name = entry.name
+        self.path = entry.path
+    
+    def is_dir(self, follow_symlinks=True):
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+    
+    def stat(self, follow_symlinks=True):
+        time.sleep(self.latency)
+        return self.entry.stat(follow_symlinks=follow_symlinks)
+
+class DirectoryScanner:
+    """
+    Sizes a tree with one pool of worker threads that lives for the whole
+    scan. Workers take directories from a shared queue, list them once with
+    os.scandir, size the files from the DirEntry.stat() results and queue
+    the subdirectories they find, so sibling subtrees are scanned in
+    parallel and an idle worker picks up whatever is left anywhere in the
+    tree.
+    
+    Files are sized with lstat semantics, so symlinks count as the link
+    itself. A file with several hard links is counted once, at the first
+    link found: only multiply linked inodes are remembered, and each is
+    forgotten again once all of its links have been seen, so the seen set
+    stays small even on trees with millions of inodes.
+    
+    With the tree of a previous scan, a directory whose mtime hasn't changed
+    since is not listed again: its own size and subdirectories are taken
+    from the previous tree, and only the subdirectories are checked. Writes
+    to existing files don't change the mtime of their directory, so sizes
+    of files that grew in place are only picked up by a full scan.
+    
+    An unexpected exception while working on a directory (OSErrors of the
+    listing are kept in DirNode.error instead) stops the scan: the other
+    workers drop what is left and scan() raises it.
+    
+    Args:
+        jobs: Number of worker threads
+        disk_usage: Size files by allocated blocks (st_blocks) instead of
+            their apparent size; directories then count their own blocks too
+        one_file_system: Skip directories on other file systems than the root
+        count_links: Count every hard link to a file instead of the file once
+        track_mtimes: Record the mtime of every directory, for snapshots
+        largest_files: Keep the sizes and names of this many of the largest
+            files in each directory listed (not in directories reused from
+            a previous scan)
+        on_scanned: Optional callable(node, top) run by a worker after it
+            listed a directory; top is the name of the first level
+            directory it is in, None for the root
+        on_complete: Optional callable(node) run once a directory and
+            everything below it has been sized
+        top: Optional TopEntries collecting the largest files and
+            directories of the whole tree (files of directories reused from
+            a previous scan are not seen)
+        fs: File system to scan through, LocalFileSystem by default
+        keep_entries: Keep the name and lstat result of every file in
+            DirNode.entries, for exports that list files; hard links
+            counted elsewhere are kept too
+        breakdown: Optional Breakdown adding up the files by extension,
+            owner or age (files of directories reused from a previous scan
+            are not seen)
+    """
+    def __init__(self, jobs=None, disk_usage=False, one_file_system=False, count_links=False,
+                 track_mtimes=False, largest_files=0, on_scanned=None, on_complete=None, top=None,
+                 fs=None, keep_entries=False, breakdown=None):
+        self.jobs = jobs or default_jobs()
+        self.disk_usage = disk_usage
+        self.one_file_system = one_file_system
+        self.count_links = count_links
+        self.track_mtimes = track_mtimes
+        self.largest_files = largest_files
+        self.on_scanned = on_scanned
+        self.on_complete = on_complete
+        self.top = top
+        self.fs = fs or LocalFileSystem
+        self.keep_entries = keep_entries
+        self.breakdown = breakdown
+        # Subdirectories are only stat'ed when their device, blocks or mtime matter
+        self._stat_dirs = disk_usage or one_file_system or track_mtimes
+        # LIFO, so the scan stays close to depth-first and the queue short
+        self._queue = []
+        self._outstanding = 0
+        self._queue_ready = threading.Condition(threading.Lock())
+        self._pending_lock = threading.Lock()
+        # (st_dev << 64 | st_ino) -> links not seen yet, for multiply linked files
+        self._links = {}
+        self._links_lock = threading.Lock()
+        # Root DirNode -> st_dev of the root, for one_file_system
+        self._root_devs = {}
+        # Directories modified after this (ns) may have changed unnoticed
+        self._trusted_before = None
+        # First unexpected exception of a worker, raised once the scan ends
+        self._error = None
+    
+    def scan(self, root_path, previous=None, previous_started=None):
+        """
+        Size the tree below root_path and return its root DirNode.
+        
+        Args:
+            root_path: Directory to scan
+            previous: Root DirNode of an earlier scan of the same directory
+                with mtimes, whose unchanged directories are reused
+            previous_started: time.time_ns() when the earlier scan started
+        """
+        if previous is not None:
+            # A directory changed within the same mtime tick as its listing
+            # would look unchanged, so recent mtimes are not trusted
+            self._trusted_before = previous_started - 2 * 10**9
+        root = self._start(root_path)
+        self._run([(root, root_path, None, previous)])
+        return root
+    
+    def scan_roots(self, root_paths):
+        """
+        Size the trees below several directories at once and return their
+        root DirNodes. All of them share the same workers, so a worker done
+        with one tree helps with the others. Hard links are counted once
+        across all of them.
+        """
+        roots = [self._start(root_path) for root_path in root_paths]
+        self._run([(root, root_path, None, None) for root, root_path in zip(roots, root_paths)])
+        return roots
+    
+    def _start(self, root_path):
+        """Stat a root as needed and return its DirNode."""
+        root = DirNode(root_path)
+        if self._stat_dirs:
+            root_stat = self.fs.stat(root_path)
+            self._root_devs[root] = root_stat.st_dev
+            root.mtime = root_stat.st_mtime_ns
+            if self.disk_usage:
+                root.size = root_stat.st_blocks * 512
+        return root
+    
+    def _root_dev(self, node):
+        """st_dev of the root of the tree node is in."""
+        while node.parent is not None:
+            node = node.parent
+        return self._root_devs[node]
+    
+    def _run(self, items):
+        """Scan the queue items of the roots to the end."""
+        self._queue.extend(items)
+        self._outstanding = len(items)
+        
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.jobs)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self._raise_error()
+    
+    def _work(self):
+        queue = self._queue
+        done = 0
+        while True:
+            with self._queue_ready:
+                # The directory taken last is done, whether it failed or not
+                self._outstanding -= done
+                if not self._outstanding:
+                    self._queue_ready.notify_all()
+                while not queue and self._outstanding:
+                    self._queue_ready.wait()
+                if not queue:
+                    # Every directory has been listed
+                    return
+                node, path, top, previous = queue.pop()
+            done = 1
+            try:
+                # After a failure the rest is only taken off the queue
+                if self._error is None:
+                    self._scan_directory(node, path, top, previous)
+            except Exception as e:
+                self._fail(e)
+    
+    def _fail(self, error):
+        """Keep the first unexpected exception of a worker."""
+        with self._pending_lock:
+            if self._error is None:
+                self._error = error
+    
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+    
+    def _scan_directory(self, node, path, top, previous):
+        if previous is not None and node.mtime is None:
+            # Subdirectory of a reused directory, not stat'ed by a listing
+            try:
+                st = self.fs.lstat(path)
+            except OSError as e:
+                st = e
+            if not self._check_directory(node, top, st):
+                return
+        if self._reuse(node, path, top, previous):
+            return
+        
+        listing = []
+        error = None
+        stat_dirs = self._stat_dirs
+        try:
+            with self.fs.scandir(path) as scanner:
+                for entry in scanner:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        st = entry.stat(follow_symlinks=False) if stat_dirs or not is_dir else None
+                    except OSError:
+                        # Skip entries that vanished or can't be stat'ed
+                        continue
+                    listing.append((entry, is_dir, st))
+        except OSError as e:
+            error = e
+        self._add_listing(node, path, top, previous, listing, error)
+    
+    def _check_directory(self, node, top, st):
+        """
+        Apply the lstat result (or OSError) of a directory that no listing
+        stat'ed; False if the directory is done with it.
+        """
+        if isinstance(st, OSError):
+            node.error = st
+            self._queue_children(node, top, [], [], [])
+            return False
+        node.mtime = st.st_mtime_ns
+        if self.disk_usage:
+            node.size = st.st_blocks * 512
+        if self.one_file_system and st.st_dev != self._root_dev(node):
+            self._queue_children(node, top, [], [], [])
+            return False
+        return True
+    
+    def _reuse(self, node, path, top, previous):
+        """
+        Take node from the previous scan if it hasn't changed since; whether
+        it was. Directories holding hard linked files are listed again:
+        which of the links counts depends on the order of the whole scan.
+        """
+        if (previous is None or previous.error is not None or previous.mtime != node.mtime
+                or node.mtime >= self._trusted_before or previous.links and not self.count_links):
+            return False
+        node.size = previous.size
+        node.files = previous.files
+        children = [DirNode(child.name, node) for child in previous.children]
+        paths = [os.path.join(path, child.name) for child in previous.children]
+        self._queue_children(node, top, children, paths, previous.children)
+        return True
+    
+    def _add_listing(self, node, path, top, previous, listing, error):
+        """
+        Size node from its listing, (entry, is_dir, lstat result) for every
+        entry (no stat result for directories unless they are stat'ed), and
+        queue its subdirectories. error is the OSError that cut the listing
+        short, if any.
+        """
+        disk_usage = self.disk_usage
+        count_links = self.count_links
+        keep = self.largest_files
+        largest = []
+        top_entries = self.top
+        if top_entries is not None:
+            top_n = top_entries.n
+            top_files = top_entries.heaps()[0]
+        # Every directory listed is on the file system of its root
+        root_dev = self._root_dev(node) if self.one_file_system else None
+        entries = [] if self.keep_entries else None
+        breakdown_tables = self.breakdown.tables() if self.breakdown is not None else ()
+        size = 0
+        files = 0
+        links = False
+        subdirs = []
+        dir_stats = []
+        for entry, is_dir, st in listing:
+            if is_dir:
+                if st is not None:
+                    if root_dev is not None and st.st_dev != root_dev:
+                        continue
+                    dir_stats.append(st)
+                subdirs.append(entry)
+                continue
+            if st.st_nlink > 1:
+                links = True
+                if not count_links and not self._first_link(st):
+                    # Exports list every link, ncdu counts them once by inode
+                    if entries is not None:
+                        entries.append((entry.name, st))
+                    continue
+            file_size = st.st_blocks * 512 if disk_usage else st.st_size
+            size += file_size
+            files += 1
+            if entries is not None:
+                entries.append((entry.name, st))
+            for key_of, table in breakdown_tables:
+                key = key_of(entry.name, st)
+                totals = table.get(key)
+                if totals is None:
+                    table[key] = [file_size, 1]
+                else:
+                    totals[0] += file_size
+                    totals[1] += 1
+            if keep:
+                # Bounded min-heap of the largest files
+                if len(largest) < keep:
+                    heapq.heappush(largest, (file_size, entry.name))
+                elif file_size > largest[0][0]:
+                    heapq.heapreplace(largest, (file_size, entry.name))
+            if top_entries is not None:
+                if len(top_files) < top_n:
+                    heapq.heappush(top_files, (file_size, entry.path))
+                elif file_size > top_files[0][0]:
+                    heapq.heapreplace(top_files, (file_size, entry.path))
+        if error is not None:
+            node.error = error
+        node.size += size
+        node.files = files
+        node.links = links
+        if keep:
+            node.largest = sorted(largest, reverse=True)
+        node.entries = entries
+        
+        children = [DirNode(entry.name, node) for entry in subdirs]
+        for child, st in zip(children, dir_stats):
+            child.mtime = st.st_mtime_ns
+            if disk_usage:
+                child.size = st.st_blocks * 512
+        
+        previous_children = None
+        if previous is not None:
+            by_name = {child.name: child for child in previous.children}
+            previous_children = [by_name.get(entry.name) for entry in subdirs]
+        self._queue_children(node, top, children, [entry.path for entry in subdirs], previous_children)
+    
+    def _queue_children(self, node, top, children, paths, previous_children):
+        """Attach the subdirectories of a listed node, queue them and finish the node."""
+        node.children = children
+        # Before queueing, so no child can complete the node early
+        node.pending += len(children)
+        if self.on_scanned is not None:
+            self.on_scanned(node, top)
+        self._enqueue([(child, paths[i], child.name if top is None else top,
+                        previous_children[i] if previous_children else None)
+                       for i, child in enumerate(children)])
+        self._finish(node)
+    
+    def _enqueue(self, items):
+        """Queue the subdirectories of a directory that has been listed."""
+        if not items:
+            return
+        with self._queue_ready:
+            self._queue.extend(items)
+            self._outstanding += len(items)
+            self._queue_ready.notify(len(items))
+
+    def _first_link(self, st):
+        """Whether st is the first link seen to a file with several links."""
+        key = st.st_dev << 64 | st.st_ino
+        with self._links_lock:
+            remaining = self._links.get(key)
+            if remaining is None:
+                self._links[key] = st.st_nlink - 1
+                return True
+            if remaining > 1:
+                self._links[key] = remaining - 1
+            else:
+                # Every link has been seen
+                del self._links[key]
+            return False
+    
+    def _finish(self, node):
+        """Count down the pending work of node and complete it and its parents."""
+        added = 0
+        while node is not None:
+            with self._pending_lock:
+                node.total += added
+                node.pending -= 1
+                if node.pending:
+                    return
+            node.total += node.size
+            if self.on_complete is not None:
+                self.on_complete(node)
+            if self.top is not None and node.parent is not None:
+                # Paths are only built for directories that make it into the heap
+                top_directories = self.top.heaps()[1]
+                if len(top_directories) < self.top.n:
+                    heapq.heappush(top_directories, (node.total, node.path()))
+                elif node.total > top_directories[0][0]:
+                    heapq.heapreplace(top_directories, (node.total, node.path()))
+            added = node.total
+            node = node.parent
+
+class AsyncDirectoryScanner(DirectoryScanner):
+    """
+    A DirectoryScanner driven by an asyncio event loop, for file systems
+    where every call waits on the network, like NFS. The blocking scandir
+    and stat calls run in a thread pool, and up to in_flight of them are
+    outstanding at once: across directories, and within one directory,
+    whose files are all stat'ed together instead of one after the other.
+    
+    Args:
+        jobs: Number of directories being worked on at once (default:
+            in_flight)
+        in_flight: Most file system calls outstanding at once
+        batch: Files stat'ed one after the other by each call, unless a
+            directory has so many that in_flight calls need more; higher
+            values cost less on fast file systems
+        options: See DirectoryScanner
+    """
+    def __init__(self, jobs=None, in_flight=64, batch=8, **options):
+        super().__init__(jobs or in_flight, **options)
+        self.in_flight = in_flight
+        self.batch = batch
+        self._loop = None
+        self._pool = None
+        self._calls = None
+        self._directories = None
+    
+    def _run(self, items):
+        asyncio.run(self._run_async(items))
+        self._raise_error()
+    
+    async def _run_async(self, items):
+        self._loop = asyncio.get_running_loop()
+        self._calls = asyncio.Semaphore(self.in_flight)
+        # LIFO for the same reason as the queue of the threaded scanner
+        self._directories = asyncio.LifoQueue()
+        for item in items:
+            self._directories.put_nowait(item)
+        with concurrent.futures.ThreadPoolExecutor(self.in_flight) as self._pool:
+            workers = [asyncio.create_task(self._work_async()) for _ in range(self.jobs)]
+            await self._directories.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def _work_async(self):
+        while True:
+            node, path, top, previous = await self._directories.get()
+            try:
+                if self._error is None:
+                    await self._scan_directory_async(node, path, top, previous)
+            except Exception as e:
+                self._fail(e)
+            finally:
+                self._directories.task_done()
+    
+    async def _call(self, function, *args):
+        """Run a blocking file system call in the pool once one of the in_flight slots is free."""
+        async with self._calls:
+            return await self._loop.run_in_executor(self._pool, function, *args)
+    
+    async def _scan_directory_async(self, node, path, top, previous):
+        if previous is not None and node.mtime is None:
+            try:
+                st = await self._call(self.fs.lstat, path)
+            except OSError as e:
+                st = e
+            if not self._check_directory(node, top, st):
+                return
+        if self._reuse(node, path, top, previous):
+            return
+        
+        entries, error = await self._call(self._read_directory, path)
+        stat_dirs = self._stat_dirs
+        to_stat = [entry for entry, is_dir in entries if stat_dirs or not is_dir]
+        # Big directories are split over all the slots, small ones into batches
+        batch = max(self.batch, -(-len(to_stat) // self.in_flight))
+        batches = await asyncio.gather(*(self._call(self._stat_entries, to_stat[i:i + batch])
+                                         for i in range(0, len(to_stat), batch)))
+        stats = itertools.chain.from_iterable(batches)
+        listing = []
+        for entry, is_dir in entries:
+            st = next(stats) if stat_dirs or not is_dir else None
+            # Skip entries that vanished or can't be stat'ed
+            if st is not False:
+                listing.append((entry, is_dir, st))
+        self._add_listing(node, path, top, previous, listing, error)
+    
+    @staticmethod
+    def _stat_entries(entries):
+        """lstat results of entries, False for the ones that failed."""
+        stats = []
+        for entry in entries:
+            try:
+                stats.append(entry.stat(follow_symlinks=False))
+            except OSError:
+                stats.append(False)
+        return stats
+    
+    def _read_directory(self, path):
+        """(entry, is_dir) pairs of a directory and the OSError that cut the listing short, if any."""
+        entries = []
+        try:
+            with self.fs.scandir(path) as scanner:
+                for entry in scanner:
+                    try:
+                        entries.append((entry, entry.is_dir(follow_symlinks=False)))
+                    except OSError:
+                        continue
+        except OSError as e:
+            return entries, e
+        return entries, None
+    
+    def _enqueue(self, items):
+        for item in items:
+            self._directories.put_nowait(item)
+
+class WorkerCounters:
+    """Progress of one scanning thread; only that thread writes to it."""
+    __slots__ = ('files', 'bytes', 'dirs', 'files_by_top')
+    
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.dirs = 0
+        self.files_by_top = {}
+
+class ScanProgress:
+    """
+    Progress of a scan, kept without locks: every worker thread updates its
+    own WorkerCounters, and first level directories are marked done with a
+    single dict assignment. The renderer sums the counters when it samples
+    them, so the scan never waits for the display.
+    
+    Args:
+        root_path: Directory being scanned
+        top_names: Names of its first level directories
+    """
+    def __init__(self, root_path, top_names):
+        self.root_path = root_path
+        self.top_names = sorted(top_names, key=str.lower)
+        self.started = time.monotonic()
+        # First level directory name -> total size once complete, None on error
+        self.done = {}
+        self.workers = []
+        self._local = threading.local()
+    
+    def counters(self):
+        """WorkerCounters of the calling thread."""
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = WorkerCounters()
+            self.workers.append(counters)
+        return counters
+    
+    def on_scanned(self, node, top):
+        counters = self.counters()
+        counters.files += node.files
+        counters.bytes += node.size
+        counters.dirs += 1
+        if top is not None:
+            counters.files_by_top[top] = counters.files_by_top.get(top, 0) + node.files
+    
+    def on_complete(self, node):
+        if node.parent is not None and node.parent.parent is None:
+            self.done[node.name] = None if node.error is not None else node.total
+    
+    def totals(self):
+        """(files, bytes, directories) scanned so far."""
+        workers = list(self.workers)
+        return (sum(w.files for w in workers), sum(w.bytes for w in workers), sum(w.dirs for w in workers))
+    
+    def top_status(self, name):
+        """Status dict of a first level directory, for colored_status."""
+        if name in self.done:
+            size = self.done[name]
+            if size is None:
+                return {"status": "error", "message": "Access Denied"}
+            return {"status": "complete", "message": format_size(size)}
+        files = sum(w.files_by_top.get(name, 0) for w in list(self.workers))
+        if files:
+            return {"status": "scanning", "message": f"Scanning... ({files} files)"}
+        return {"status": "pending", "message": "Pending..."}
+
+class RootsProgress(ScanProgress):
+    """Progress of a scan of several roots at once, shown root by root."""
+    def __init__(self, root_paths):
+        super().__init__(", ".join(root_paths), [])
+        self.top_names = list(root_paths)
+    
+    def on_scanned(self, node, top):
+        counters = self.counters()
+        counters.files += node.files
+        counters.bytes += node.size
+        counters.dirs += 1
+        root = node
+        while root.parent is not None:
+            root = root.parent
+        counters.files_by_top[root.name] = counters.files_by_top.get(root.name, 0) + node.files
+    
+    def on_complete(self, node):
+        if node.parent is None:
+            self.done[node.name] = None if node.error is not None else node.total
+
+class ProgressRenderer:
+    """
+    Draws a ScanProgress from its own thread. On a terminal the progress
+    block is redrawn in place with cursor movement, one write per frame;
+    otherwise a plain log line is written every log_interval seconds.
+    """
+    def __init__(self, progress, stream=None, interval=0.5, log_interval=5.0):
+        self.progress = progress
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = interval if self.tty else log_interval
+        self._lines = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        if self.tty:
+            self.stream.write("\033[?25l")  # Hide the cursor
+        self._thread.start()
+    
+    def stop(self):
+        """Stop drawing and erase the progress block."""
+        self._stop.set()
+        self._thread.join()
+        if self.tty:
+            self.stream.write(self._erase() + "\033[?25h")
+            self.stream.flush()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.tty:
+                self._draw()
+            else:
+                self.stream.write(self._summary() + "\n")
+                self.stream.flush()
+    
+    def _summary(self):
+        files, size, dirs = self.progress.totals()
+        elapsed = max(time.monotonic() - self.progress.started, 1e-9)
+        return (f"Scanned {files:,} files, {format_size(size)} in {dirs:,} directories "
+                f"({dirs / elapsed:,.0f} dirs/s)")
+    
+    def _erase(self):
+        # Back to the first line of the block and clear everything below it
+        return f"\033[{self._lines}F\033[J" if self._lines else ""
+    
+    def _draw(self):
+        width, height = shutil.get_terminal_size()
+        lines = [f"Scanning: {self.progress.root_path}"[:width - 1], self._summary()[:width - 1], ""]
+        names = self.progress.top_names
+        # Lines that wrap or scroll would break the cursor movement
+        room = max(0, height - len(lines) - 2)
+        for name in names[:room]:
+            status = self.progress.top_status(name)
+            name = name[:max(0, width - len(status["message"]) - 7)]
+            lines.append(f"|- ({colored_status(status)}) {name}")
+        if len(names) > room:
+            lines.append(f"   ... {len(names) - room} more")
+        
+        frame = self._erase() + "\n".join(line + "\033[K" for line in lines) + "\n"
+        self._lines = len(lines)
+        self.stream.write(frame)
+        self.stream.flush()
+
+class StreamExporter:
+    """
+    Writes the tree to out while it is being scanned. Workers only hand
+    directories over through a queue, and a thread of the exporter's own
+    formats and writes them, then drops the parts of the tree it no longer
+    needs, so memory stays bounded by the part of the tree in progress
+    rather than by its size. The queue is bounded too: when the writer
+    falls behind, the workers wait for it instead of piling up listings.
+    
+    When writing fails, e.g. because the reader of a pipe went away, the
+    error is kept in error and the rest of the tree is dropped, so the scan
+    still ends.
+    """
+    QUEUE_SIZE = 1024
+    on_scanned = None
+    on_complete = None
+    # Whether DirNode.entries have to be kept for the export
+    needs_entries = False
+    
+    def __init__(self, roots, out=None):
+        # Root path as scanned -> path to show for it
+        self.roots = roots
+        self.out = out or sys.stdout
+        self._nodes = queue.Queue(self.QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._write_all, daemon=True)
+        self._failed = threading.Event()
+        self.error = None
+    
+    def start(self):
+        self._thread.start()
+    
+    def finish(self):
+        """Write what is left once the scan is done."""
+        self._put(None)
+        self._thread.join()
+        if not self._failed.is_set():
+            try:
+                self.out.flush()
+            except OSError as e:
+                self.error = e
+    
+    def _put(self, node):
+        """Hand node over to the writer, unless writing failed: then nobody takes it."""
+        while not self._failed.is_set():
+            try:
+                self._nodes.put(node, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+    
+    def _write_all(self):
+        try:
+            self._run()
+        except (OSError, ValueError) as e:
+            # OSError such as BrokenPipeError, ValueError if out was closed
+            self.error = e
+            self._failed.set()
+    
+    def _run(self):
+        while True:
+            node = self._nodes.get()
+            if node is None:
+                return
+            self._write(node)
+    
+    def _path(self, node):
+        """(root DirNode, path to show) of node."""
+        names = []
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return node, os.path.join(self.roots[node.name], *reversed(names))
+
+class NdjsonExporter(StreamExporter):
+    """
+    One NDJSON record per directory as soon as everything below it is
+    sized, so directories come in completion order with children before
+    their parents, and a summary record once a root is complete.
+    """
+    def __init__(self, roots, out=None):
+        super().__init__(roots, out)
+        # Root DirNode -> [files, directories] written so far
+        self._counts = defaultdict(lambda: [0, 0])
+    
+    def on_complete(self, node):
+        self._put(node)
+    
+    def _write(self, node):
+        root, path = self._path(node)
+        counts = self._counts[root]
+        counts[0] += node.files
+        counts[1] += 1
+        record = {"type": "directory", "path": path, "size": node.total, "own_size": node.size,
+                  "files": node.files, "error": str(node.error) if node.error is not None else None}
+        self.out.write(json.dumps(record) + "\n")
+        if node is root:
+            self.out.write(json.dumps({"type": "summary", "root": path, "total": node.total,
+                                       "files": counts[0], "directories": counts[1]}) + "\n")
+            del self._counts[root]
+        # Every child has been written before its parent completed
+        node.children = []
+
+class NcduExporter(StreamExporter):
+    """
+    The tree in the JSON export format of ncdu, to browse it offline with
+    ncdu -f; the format has room for a single root. The format nests every
+    directory inside its parent, so directories are written in pre-order:
+    each one as soon as it and the directories before it have been listed.
+    Subdirectories are written last first, the order the LIFO queue of the
+    scan takes them in, so few listings wait for their turn.
+    """
+    needs_entries = True
+    
+    def on_scanned(self, node, top):
+        self._put(node)
+    
+    def _run(self):
+        out = self.out
+        out.write(json.dumps([1, 2, {"progname": "dua.py", "progver": "1.0", "timestamp": int(time.time())}])[:-1])
+        # The root is listed before anything else
+        root = self._nodes.get()
+        if root is not None:
+            self._write_directory(root)
+        # [directory, children left to write] down to the current one
+        stack = [[root, len(root.children)]] if root is not None else []
+        # Listed directories that aren't next in pre-order yet
+        listed = set()
+        while True:
+            node = self._nodes.get()
+            if node is None:
+                break
+            listed.add(node)
+            while stack:
+                current = stack[-1]
+                directory, left = current
+                if not left:
+                    out.write("]")
+                    stack.pop()
+                    # Done with the whole subtree
+                    directory.children = []
+                    continue
+                child = directory.children[left - 1]
+                if child not in listed:
+                    break
+                listed.discard(child)
+                current[1] -= 1
+                self._write_directory(child)
+                stack.append([child, len(child.children)])
+        out.write("]\n")
+    
+    def _write_directory(self, node):
+        info = {"name": self.roots[node.name] if node.parent is None else node.name}
+        if node.error is not None:
+            info["read_error"] = True
+        parts = [json.dumps(info)]
+        dumps = json.dumps
+        # Formatted by hand, json.dumps of a dict per file would fall behind the scan
+        for name, st in node.entries or ():
+            dsize = st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+            entry = f'{{"name":{dumps(name)},"asize":{st.st_size},"dsize":{dsize}'
+            if st.st_nlink > 1:
+                entry += f',"ino":{st.st_ino},"hlnkc":true,"nlink":{st.st_nlink}'
+            if not stat.S_ISREG(st.st_mode):
+                entry += ',"notreg":true'
+            parts.append(entry + "}")
+        node.entries = None
+        self.out.write(",\n[" + ",\n".join(parts))
+
+# Exporter class of each streamed --output format
+EXPORTERS = {"ndjson": NdjsonExporter, "ncdu": NcduExporter}
+
+# Scanner class of each --backend
+BACKENDS = {"threads": DirectoryScanner, "asyncio": AsyncDirectoryScanner}
+
+def scan_tree(path, progress=None, jobs=None, previous=None, previous_started=None, backend="threads",
+              exporter=None, **options):
+    """
+    Size the tree below path with the scanner of backend and return its
+    root DirNode. previous and previous_started are passed on to
+    DirectoryScanner.scan, options to the scanner. progress is an optional
+    ScanProgress to update, exporter an optional StreamExporter to hand
+    the directories to.
+    """
+    scanner = make_scanner(progress, jobs, backend, exporter, **options)
+    return scanner.scan(handle_long_path(path), previous, previous_started)
+
+def scan_trees(paths, progress=None, jobs=None, backend="threads", exporter=None, **options):
+    """
+    Size the trees below several paths with the same workers and return
+    their root DirNodes, see DirectoryScanner.scan_roots and scan_tree.
+    """
+    scanner = make_scanner(progress, jobs, backend, exporter, **options)
+    return scanner.scan_roots([handle_long_path(path) for path in paths])
+
+def make_scanner(progress=None, jobs=None, backend="threads", exporter=None, **options):
+    """The scanner of backend, reporting to progress and exporter, see scan_tree."""
+    listeners = [listener for listener in (progress, exporter) if listener is not None]
+    for callback in ("on_scanned", "on_complete"):
+        functions = [getattr(listener, callback) for listener in listeners
+                     if getattr(listener, callback) is not None]
+        if len(functions) == 1:
+            options[callback] = functions[0]
+        elif functions:
+            def call_all(*args, functions=functions):
+                for function in functions:
+                    function(*args)
+            options[callback] = call_all
+    if exporter is not None and exporter.needs_entries:
+        options["keep_entries"] = True
+    return BACKENDS[backend](jobs, **options)
+
+def get_directory_size(path, jobs=None, **options):
+    """Total size of the tree below path, see scan_tree."""
+    return scan_tree(path, None, jobs, **options).total
+
+class Snapshot:
+    """
+    Per-directory totals and mtimes of the last scan of a directory, stored
+    in SQLite so the next scan only has to list directories that changed.
+    
+    Directories are stored in pre-order with the id of their parent, so
+    loading rebuilds the tree in a single pass over the rows. Names and the
+    root are os.fsencode BLOBs, as names needn't be valid UTF-8.
+    """
+    SCHEMA_VERSION = 3
+    
+    def __init__(self, db_path, read_only=False):
+        """
+        With read_only the file is opened as it is, e.g. to merge it: a
+        snapshot of another schema version raises ValueError instead of
+        being emptied and recreated.
+        """
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                self.conn.close()
+                raise ValueError(f"schema version {version} instead of {self.SCHEMA_VERSION}, "
+                                 f"rescan with --snapshot to update it")
+            return
+        
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS scan")
+            self.conn.execute("DROP TABLE IF EXISTS directories")
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS scan (root BLOB, options TEXT, started INTEGER)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS directories ("
+            "id INTEGER PRIMARY KEY, parent INTEGER, name BLOB, mtime_ns INTEGER, "
+            "size INTEGER, files INTEGER, total INTEGER, error INTEGER, links INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent)")
+    
+    def load(self):
+        """
+        Return (root path, scan options, start time in ns, root DirNode) of the
+        stored scan, or None if there is none.
+        """
+        scan = self.scan_info()
+        if scan is None:
+            return None
+        nodes = []
+        rows = self.conn.execute(
+            "SELECT parent, name, mtime_ns, size, files, total, error, links FROM directories ORDER BY id")
+        for parent, name, mtime, size, files, total, error, links in rows:
+            node = DirNode(os.fsdecode(name), nodes[parent] if parent is not None else None)
+            node.mtime = mtime
+            node.size = size
+            node.files = files
+            node.total = total
+            node.pending = 0
+            # Only whether the listing failed is kept
+            node.error = True if error else None
+            node.links = bool(links)
+            if parent is not None:
+                nodes[parent].children.append(node)
+            nodes.append(node)
+        if not nodes:
+            return None
+        return (*scan, nodes[0])
+    
+    def scan_info(self):
+        """(root path, scan options, start time in ns) of the stored scan, or None."""
+        scan = self.conn.execute("SELECT root, options, started FROM scan").fetchone()
+        return (os.fsdecode(scan[0]), json.loads(scan[1]), scan[2]) if scan is not None else None
+    
+    def directories(self):
+        """
+        Yield (path, size, files, total, error) of every stored directory,
+        sorted by its path relative to the root (b'' for the root, b'/'
+        between names) as os.fsencode bytes. The tree is walked by SQLite
+        with its queue ordered by path, so the rows stream out sorted without
+        loading the tree.
+        """
+        yield from self.conn.execute(
+            "WITH RECURSIVE tree(id, path, size, files, total, error) AS ("
+            " SELECT id, X'', size, files, total, error FROM directories WHERE parent IS NULL"
+            " UNION ALL"
+            " SELECT d.id, CASE WHEN tree.path = X'' THEN d.name ELSE CAST(tree.path || X'2F' || d.name AS BLOB) END,"
+            " d.size, d.files, d.total, d.error"
+            " FROM directories d JOIN tree ON d.parent = tree.id"
+            " ORDER BY 2)"
+            " SELECT path, size, files, total, error FROM tree")
+    
+    def save(self, root_path, options, started, tree):
+        """Replace the stored scan with tree."""
+        with self.conn:
+            self.conn.execute("DELETE FROM scan")
+            self.conn.execute("DELETE FROM directories")
+            self.conn.execute("INSERT INTO scan VALUES (?, ?, ?)",
+                              (os.fsencode(root_path), json.dumps(options, sort_keys=True), started))
+            self.conn.executemany("INSERT INTO directories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self._rows(tree))
+    
+    def close(self):
+        self.conn.close()
+    
+    @staticmethod
+    def _rows(tree):
+        next_id = 0
+        stack = [(tree, None)]
+        while stack:
+            node, parent = stack.pop()
+            node_id = next_id
+            next_id += 1
+            yield (node_id, parent, os.fsencode(node.name), node.mtime, node.size, node.files, node.total,
+                   node.error is not None, node.links)
+            stack.extend((child, node_id) for child in reversed(node.children))
+
+def diff_trees(old, new):
+    """
+    Yield (path, old total, new total) for every directory whose total
+    differs between two scans of the same root. A directory missing from
+    one of them counts as 0 there.
+    """
+    stack = [(old, new, new.name)]
+    while stack:
+        old_node, new_node, path = stack.pop()
+        old_total = old_node.total if old_node is not None else 0
+        new_total = new_node.total if new_node is not None else 0
+        if old_total != new_total:
+            yield path, old_total, new_total
+        
+        old_children = {child.name: child for child in old_node.children} if old_node is not None else {}
+        new_children = {child.name: child for child in new_node.children} if new_node is not None else {}
+        for name in old_children.keys() | new_children.keys():
+            stack.append((old_children.get(name), new_children.get(name), os.path.join(path, name)))
+
+def print_diff(old, new, started, limit=20):
+    """Print the directories that grew the most since the scan of old."""
+    grown = sorted((new_total - old_total, path) for path, old_total, new_total in diff_trees(old, new)
+                   if new_total > old_total)
+    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(started / 10**9))
+    print(f"\nGrowth since the snapshot of {when}: {GREEN}{format_size(new.total - old.total)}{RESET}"
+          if new.total >= old.total else
+          f"\nShrunk since the snapshot of {when}: {RED}{format_size(old.total - new.total)}{RESET}")
+    if not grown:
+        print("No directory grew")
+    for growth, path in reversed(grown[-limit:]):
+        print(f"|- ({YELLOW}+{format_size(growth)}{RESET}) {path}")
+
+def print_top(top_entries):
+    """Print the largest files and directories of a scan as ranked tables."""
+    for title, entries in (("files", top_entries.files()), ("directories", top_entries.directories())):
+        print(f"\nLargest {title}:")
+        if not entries:
+            print("None found")
+        width = len(str(len(entries)))
+        for rank, (size, path) in enumerate(entries, 1):
+            print(f"{rank:>{width}}. {GREEN}{format_size(size):>12}{RESET}  {path}")
+
+def print_breakdown(file_totals, limit=20):
+    """Print the totals of a Breakdown, the limit largest rows of each field."""
+    titles = {"extension": "extension", "owner": "owner", "mtime": "last modification",
+              "atime": "last access"}
+    for field in file_totals.fields:
+        rows = file_totals.totals(field)
+        print(f"\nSize by {titles[field]}:")
+        if not rows:
+            print("No files found")
+        for label, size, files in rows[:limit]:
+            print(f"|- ({GREEN}{format_size(size)}{RESET}) {label} ({files} files)")
+        if len(rows) > limit:
+            print(f"   ... {len(rows) - limit} more")
+
+def directory_status(node):
+    """Status dict of a scanned directory, for colored_status."""
+    if node.error is not None:
+        return {"status": "error", "message": "Access Denied"}
+    return {"status": "complete", "message": format_size(node.total)}
+
+def scan_record(root_path, tree):
+    """JSON-ready summary of a scanned tree: its total and first level directories."""
+    return {
+        "root": root_path,
+        "total": tree.total,
+        "directories": [
+            {"name": child.name, "size": child.total,
+             "error": str(child.error) if child.error is not None else None}
+            for child in sorted(tree.children, key=lambda child: child.name.lower())
+        ],
+    }
+
+def add_details(record, top_entries=None, file_totals=None):
+    """Add the largest entries and breakdowns of a scan to its JSON-ready record."""
+    if top_entries is not None:
+        record["largest_files"] = [{"rank": rank, "size": size, "path": path}
+                                   for rank, (size, path) in enumerate(top_entries.files(), 1)]
+        record["largest_directories"] = [{"rank": rank, "size": size, "path": path}
+                                         for rank, (size, path) in enumerate(top_entries.directories(), 1)]
+    if file_totals is not None:
+        record["breakdown"] = {field: [{"key": label, "size": size, "files": files}
+                                       for label, size, files in file_totals.totals(field)]
+                               for field in file_totals.fields}
+
+def merge_directories(snapshots):
+    """
+    Merge the directories of several snapshots into one aggregate tree,
+    matched by their path relative to each root. Yields (path, size,
+    files, total, error, sources) in path order, summed over the sources
+    snapshots that have the directory. The sorted streams of the snapshots
+    are merged with heapq.merge, so only one row per snapshot is in memory.
+    """
+    rows = heapq.merge(*(snapshot.directories() for snapshot in snapshots))
+    # Merged as bytes, the order SQLite sorts them in
+    for path, group in itertools.groupby(rows, key=lambda row: row[0]):
+        path = os.fsdecode(path)
+        size = files = total = sources = 0
+        error = False
+        for _, row_size, row_files, row_total, row_error in group:
+            size += row_size
+            files += row_files
+            total += row_total
+            error = error or bool(row_error)
+            sources += 1
+        yield path, size, files, total, error, sources
+
+def merge_snapshots(snapshot_paths, output="text"):
+    """
+    Print the aggregate tree of several snapshot files, e.g. taken with
+    --snapshot on different machines. text and json show the total and the
+    first level directories, ndjson streams every merged directory.
+    """
+    snapshots = []
+    scans = []
+    for path in snapshot_paths:
+        try:
+            if not os.path.isfile(path):
+                raise OSError(f"No such file: {path}")
+            snapshot = Snapshot(path, read_only=True)
+            scan = snapshot.scan_info()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            scan = None
+            print(f"{RED}Couldn't read snapshot {path}: {str(e)}{RESET}", file=sys.stderr)
+        else:
+            snapshots.append(snapshot)
+            if scan is None:
+                print(f"{RED}Snapshot {path} holds no scan{RESET}", file=sys.stderr)
+        if scan is None:
+            for snapshot in snapshots:
+                snapshot.close()
+            return False
+        scans.append(scan)
+    if any(scan[1] != scans[0][1] for scan in scans):
+        print("Warning: The snapshots were taken with different options, their sizes may not add up",
+              file=sys.stderr)
+    
+    sources = [{"snapshot": path, "root": root, "started": started}
+               for path, (root, _, started) in zip(snapshot_paths, scans)]
+    total = 0
+    first_level = []
+    for path, size, files, directory_total, error, count in merge_directories(snapshots):
+        if output == "ndjson":
+            record = {"type": "directory", "path": path or ".", "size": directory_total, "own_size": size,
+                      "files": files, "error": error, "sources": count}
+            sys.stdout.write(json.dumps(record) + "\n")
+        if not path:
+            total = directory_total
+        elif "/" not in path:
+            first_level.append((path, directory_total, error))
+    for snapshot in snapshots:
+        snapshot.close()
+    
+    if output == "ndjson":
+        print(json.dumps({"type": "summary", "sources": sources, "total": total}))
+    elif output == "json":
+        record = {"sources": sources, "total": total,
+                  "directories": [{"name": name, "size": size, "error": error}
+                                  for name, size, error in sorted(first_level, key=lambda row: row[0].lower())]}
+        json.dump(record, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"Merged {len(snapshots)} snapshots:")
+        for source in sources:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(source["started"] / 10**9))
+            print(f"  {source['snapshot']}: {source['root']} ({when})")
+        print(f"Total size: {GREEN}{format_size(total)}{RESET}")
+        for name, size, error in sorted(first_level, key=lambda row: row[0].lower()):
+            if error:
+                status = {"status": "error", "message": "Access Denied"}
+            else:
+                status = {"status": "complete", "message": format_size(size)}
+            print(f"|- ({colored_status(status)}) {name}")
+    return True
+
+def format_size(size_in_bytes):
+    if size_in_bytes is None:
+        return "Access Denied"
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size_in_bytes < 1024:
+            return f"{size_in_bytes:.2f} {unit}"
+        size_in_bytes /= 1024
+
+def colored_status(status_dict):
+    if status_dict is None:
+        return f"{YELLOW}Pending...{RESET}"
+    
+    status = status_dict.get("status", "pending")
+    message = status_dict.get("message", "Pending...")
+    
+    if status == "pending":
+        return f"{YELLOW}{message}{RESET}"
+    elif status == "scanning":
+        return f"{CYAN}{message}{RESET}"
+    elif status == "complete":
+        return f"{GREEN}{message}{RESET}"
+    elif status == "error":
+        return f"{RED}{message}{RESET}"
+    return message
+
+def browse(tree):
+    """
+    Browse a scanned tree in an interactive curses view. Everything shown
+    comes from the tree, so moving between directories never rescans.
+    """
+    try:
+        import curses
+    except ImportError:
+        print(f"{RED}The interactive browser needs the curses module{RESET}")
+        return
+    curses.wrapper(_browse, tree)
+
+def _browse_rows(node, by_name):
+    """(size, name, DirNode or None for files) shown for node."""
+    rows = [(child.total, child.name + os.sep, child) for child in node.children]
+    rows.extend((size, name, None) for size, name in node.largest or ())
+    if by_name:
+        rows.sort(key=lambda row: row[1].lower())
+    else:
+        rows.sort(key=lambda row: row[0], reverse=True)
+    return rows
+
+def _browse(screen, tree):
+    import curses
+    curses.curs_set(0)
+    if curses.has_colors():
+        curses.use_default_colors()
+        curses.init_pair(1, curses.COLOR_CYAN, -1)
+        curses.init_pair(2, curses.COLOR_RED, -1)
+    node = tree
+    selected = 0
+    first_row = 0
+    by_name = False
+    # (selected, first row) of the directories above the current one
+    history = []
+    
+    def draw(y, text, attr=0):
+        try:
+            screen.addnstr(y, 0, text, max(0, width - 1), attr)
+        except curses.error:
+            pass
+    
+    while True:
+        rows = _browse_rows(node, by_name)
+        height, width = screen.getmaxyx()
+        visible = max(1, height - 3)
+        selected = max(0, min(selected, len(rows) - 1))
+        if selected < first_row:
+            first_row = selected
+        elif selected >= first_row + visible:
+            first_row = selected - visible + 1
+        
+        screen.erase()
+        draw(0, f" {node.path()}  {format_size(node.total)} in {len(node.children)} directories", curses.A_BOLD)
+        for i, (size, name, child) in enumerate(rows[first_row:first_row + visible]):
+            share = size / node.total if node.total else 0
+            bar = "#" * round(share * 10)
+            flag = "!" if child is not None and child.error is not None else " "
+            attr = curses.A_REVERSE if first_row + i == selected else 0
+            if child is not None and curses.has_colors():
+                attr |= curses.color_pair(2 if child.error is not None else 1)
+            draw(i + 2, f"{flag}{format_size(size):>12} {share:6.1%} [{bar:<10}] {name}", attr)
+        if not rows:
+            draw(2, "  (empty)")
+        draw(height - 1, " arrows/jk move  enter/l open  backspace/h up  s sort by "
+             + ("size" if by_name else "name") + "  q quit", curses.A_DIM)
+        screen.refresh()
+        
+        key = screen.getch()
+        if key in (ord("q"), 27):
+            return
+        elif key in (curses.KEY_DOWN, ord("j")):
+            selected += 1
+        elif key in (curses.KEY_UP, ord("k")):
+            selected -= 1
+        elif key == curses.KEY_NPAGE:
+            selected += visible
+        elif key == curses.KEY_PPAGE:
+            selected -= visible
+        elif key == curses.KEY_HOME:
+            selected = 0
+        elif key == curses.KEY_END:
+            selected = len(rows) - 1
+        elif key == ord("s"):
+            by_name = not by_name
+        elif key in (curses.KEY_RIGHT, curses.KEY_ENTER, 10, 13, ord("l")):
+            if rows and rows[selected][2] is not None:
+                history.append((selected, first_row))
+                node = rows[selected][2]
+                selected = first_row = 0
+        elif key in (curses.KEY_LEFT, curses.KEY_BACKSPACE, 127, 8, ord("h")):
+            if history:
+                node = node.parent
+                selected, first_row = history.pop()
+
+def scan_directory(root_path, jobs=None, snapshot=None, diff=None, interactive=False, top=0,
+                   output="text", breakdown=(), **options):
+    """
+    Scan root_path showing progress and print the results.
+    
+    Args:
+        root_path: Directory to scan, or a list of directories to scan at
+            once with the same workers (without snapshot, diff or
+            interactive)
+        jobs: Number of scanning threads
+        snapshot: Optional snapshot file; unchanged directories of the scan
+            stored in it are reused, and the new scan replaces it
+        diff: Optional snapshot file to show growth against; '' for the
+            scan stored in snapshot before it is replaced
+        interactive: Browse the scanned tree instead of printing it
+        top: Also report this many of the largest files and directories
+        breakdown: Also report the files by these Breakdown.FIELDS
+        output: "text", "json" for a summary, or "ndjson" or "ncdu" to
+            stream the tree while it is scanned; with anything but text the
+            progress goes to stderr
+        options: Passed on to DirectoryScanner
+    """
+    display_paths = [root_path] if isinstance(root_path, str) else list(root_path)
+    several = len(display_paths) > 1
+    snapshot_roots = [os.path.abspath(path) for path in display_paths]
+    snapshot_root = snapshot_roots[0]
+    # Only options that change sizes decide whether a snapshot can be reused
+    size_options = {key: value for key, value in options.items()
+                    if key not in ("largest_files", "backend", "in_flight")}
+    root_paths = [handle_long_path(path) for path in display_paths]
+    root_path = root_paths[0]
+    messages = sys.stderr if output != "text" else sys.stdout
+    
+    if several:
+        progress = RootsProgress(root_paths)
+    else:
+        # First level directories are listed once, for the progress display
+        try:
+            with os.scandir(root_path) as scanner:
+                top_names = [entry.name for entry in scanner if entry.is_dir(follow_symlinks=False)]
+        except (PermissionError, OSError):
+            print(f"{RED}Error accessing the root directory{RESET}", file=messages)
+            return
+        progress = ScanProgress(root_path, top_names)
+    
+    previous = previous_started = None
+    snapshot_file = None
+    if snapshot is not None:
+        try:
+            snapshot_file = Snapshot(snapshot)
+            stored = snapshot_file.load()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Warning: Snapshot disabled: {str(e)}", file=sys.stderr)
+            snapshot_file = stored = None
+        # Totals of another root or with other options can't be reused
+        if stored is not None and stored[:2] == (snapshot_root, size_options):
+            previous_started, previous = stored[2], stored[3]
+    
+    diff_against = None
+    if diff == "":
+        diff_against = (previous_started, previous) if previous is not None else None
+    elif diff is not None:
+        try:
+            other = Snapshot(diff)
+            stored = other.load()
+            other.close()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Warning: Couldn't read snapshot {diff}: {str(e)}", file=sys.stderr)
+            stored = None
+        if stored is not None:
+            diff_against = (stored[2], stored[3])
+    
+    top_entries = TopEntries(top) if top else None
+    file_totals = Breakdown(breakdown) if breakdown else None
+    if top_entries is not None or file_totals is not None:
+        # Files of reused directories aren't listed, so they couldn't be counted
+        previous = previous_started = None
+    
+    exporter = None
+    if output in EXPORTERS:
+        exporter = EXPORTERS[output](dict(zip(root_paths, snapshot_roots)))
+        exporter.start()
+    renderer = ProgressRenderer(progress, messages)
+    renderer.start()
+    
+    # Perform the scan
+    started = time.time_ns()
+    trees = None
+    scan_options = dict(top=top_entries, exporter=exporter, breakdown=file_totals, **options)
+    try:
+        if several:
+            trees = scan_trees(root_paths, progress, jobs, **scan_options)
+        else:
+            trees = [scan_tree(root_path, progress, jobs, previous, previous_started,
+                               track_mtimes=snapshot_file is not None, **scan_options)]
+    except Exception as e:
+        error = e
+    else:
+        error = None
+    finally:
+        # Also on Ctrl+C, which would leave the terminal without a cursor
+        renderer.stop()
+    if exporter is not None:
+        exporter.finish()
+        if isinstance(exporter.error, BrokenPipeError):
+            # The reader went away, e.g. | head: nothing more can be written
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        elif exporter.error is not None:
+            print(f"{RED}Error writing the {output} output: {str(exporter.error)}{RESET}", file=sys.stderr)
+    if error is not None:
+        print(f"{RED}Error during scan: {str(error)}{RESET}", file=messages)
+    tree = trees[0] if trees else None
+    
+    if snapshot_file is not None:
+        if tree is not None:
+            try:
+                snapshot_file.save(snapshot_root, size_options, started, tree)
+            except sqlite3.Error as e:
+                print(f"Warning: Couldn't update snapshot: {str(e)}", file=sys.stderr)
+        snapshot_file.close()
+    
+    if interactive and tree is not None:
+        browse(tree)
+        return
+    
+    if exporter is not None or trees is None:
+        return
+    if output == "json":
+        if several:
+            record = {"roots": [scan_record(path, tree) for path, tree in zip(snapshot_roots, trees)],
+                      "total": sum(tree.total for tree in trees)}
+        else:
+            record = scan_record(snapshot_root, tree)
+        add_details(record, top_entries, file_totals)
+        json.dump(record, sys.stdout, indent=2)
+        print()
+        return
+    
+    # Display final results
+    for path, tree in zip(display_paths, trees):
+        print(f"Complete scan results for: {path}")
+        print(f"Total size: {GREEN}{format_size(tree.total)}{RESET}")
+        for child in sorted(tree.children, key=lambda child: child.name.lower()):
+            print(f"|- ({colored_status(directory_status(child))}) {child.name}")
+        if several:
+            print()
+    if several:
+        print(f"Total size of {len(trees)} directories: {GREEN}{format_size(sum(tree.total for tree in trees))}{RESET}")
+    
+    if top_entries is not None:
+        print_top(top_entries)
+    if file_totals is not None:
+        print_breakdown(file_totals)
+    
+    if diff is not None and tree is not None:
+        if diff_against is None:
+            print("\nNo earlier snapshot to compare with")
+        else:
+            print_diff(diff_against[1], tree, diff_against[0])
+
+def parse_merge_args(argv):
+    parser = argparse.ArgumentParser(prog="dua.py merge",
+                                     description="Merge snapshots, e.g. of several machines, into one aggregate tree; "
+                                                 "directories are matched by their path below each root.")
+    parser.add_argument("snapshots", nargs="+", metavar="SNAPSHOT",
+                        help="snapshot files written with --snapshot")
+    parser.add_argument("--output", choices=["text", "json", "ndjson"], default="text",
+                        help="output format: json for a summary, ndjson for every merged directory (default: text)")
+    args = parser.parse_args(argv)
+    args.command = "merge"
+    return args
+
+def parse_args(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["merge"]:
+        return parse_merge_args(argv[1:])
+    parser = argparse.ArgumentParser(description="Disk usage of a directory, broken down by first level directory. "
+                                                 "'dua.py merge SNAPSHOT...' merges snapshots instead.")
+    parser.add_argument("paths", nargs="*", metavar="path",
+                        help="directories to scan, several at once with the same workers (default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help=f"number of directory scanning threads (0 = {default_jobs()} on this machine), "
+                             "or of directories scanned at once with --backend asyncio (0 = --in-flight)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="threads",
+                        help="threads: a pool of scanning threads; asyncio: many file system calls in flight "
+                             "at once, for NFS and other high latency mounts (default: threads)")
+    parser.add_argument("--in-flight", type=int, default=64, metavar="N",
+                        help="most file system calls outstanding at once with --backend asyncio (default: 64)")
+    parser.add_argument("--test", action="store_true", help="run the built-in tests")
+    parser.add_argument("--disk-usage", action="store_true",
+                        help="report space allocated on disk (st_blocks) instead of apparent file sizes")
+    parser.add_argument("-x", "--one-file-system", action="store_true",
+                        help="skip directories on other file systems")
+    parser.add_argument("-l", "--count-links", action="store_true",
+                        help="count sizes of hard linked files once per link instead of once")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="reuse totals of unchanged directories from this snapshot and update it after the scan")
+    parser.add_argument("--diff", nargs="?", const="", metavar="SNAPSHOT",
+                        help="show which directories grew since SNAPSHOT (default: the previous --snapshot scan)")
+    parser.add_argument("-i", "--interactive", action="store_true",
+                        help="browse the results in an interactive view after the scan")
+    parser.add_argument("--largest-files", type=int, default=0, metavar="N",
+                        help="also keep the N largest files of every directory for the interactive view")
+    parser.add_argument("--top", type=int, default=0, metavar="N",
+                        help="also report the N largest files and directories of the whole tree")
+    parser.add_argument("--by", action="append", choices=Breakdown.FIELDS, default=[],
+                        help="also break the size of the files down by extension, owner, or age of their "
+                             "last modification (mtime) or access (atime); can be repeated")
+    parser.add_argument("--output", choices=["text", "json"] + sorted(EXPORTERS), default="text",
+                        help="output format: json for a summary, ndjson for one record per directory streamed "
+                             "as the scan goes, ncdu for the export format of ncdu (ncdu -f FILE to browse it); "
+                             "anything but text sends progress to stderr (default: text)")
+    args = parser.parse_args(argv)
+    args.command = "scan"
+    args.paths = args.paths or [os.getcwd()]
+    if len(args.paths) > 1 and (args.snapshot is not None or args.diff is not None or args.interactive
+                                or args.output == "ncdu"):
+        parser.error("--snapshot, --diff, -i and --output ncdu take a single path")
+    if args.diff == "" and args.snapshot is None:
+        parser.error("--diff without a snapshot file needs --snapshot")
+    if args.disk_usage and not hasattr(os.stat_result, "st_blocks"):
+        parser.error("--disk-usage isn't supported on this platform")
+    if args.in_flight < 1:
+        parser.error("--in-flight must be at least 1")
+    if args.top < 0:
+        parser.error("--top must be positive")
+    if args.output != "text" and (args.interactive or args.diff is not None):
+        parser.error(f"--output {args.output} can't be combined with -i or --diff")
+    if args.output in EXPORTERS and (args.snapshot is not None or args.top or args.by):
+        # The streamed tree is dropped as it is written, and reused directories aren't listed
+        parser.error(f"--output {args.output} can't be combined with --snapshot, --top or --by")
+    return args
+
+def run_tests():
+    """Run some basic tests of the scanners."""
+    print("Running tests...\n")
+    
+    all_tests_passed = True
+    test_dir = tempfile.mkdtemp(prefix="dua_test_")
+    
+    try:
+        # Test 1: Both backends size the same tree the same way
+        print("TEST 1: Threaded and asyncio scanners agree with the known sizes")
+        print("---------------------------------------------------------------")
+        
+        expected = {}
+        for i, directory in enumerate(["", "a", os.path.join("a", "b"), "c"]):
+            os.makedirs(os.path.join(test_dir, directory), exist_ok=True)
+            for j in range(10):
+                with open(os.path.join(test_dir, directory, f"file{j}.bin"), "wb") as f:
+                    f.write(b"x" * (100 * i + j))
+                expected[directory] = expected.get(directory, 0) + 100 * i + j
+        # A second link to a file is only counted once
+        os.link(os.path.join(test_dir, "c", "file4.bin"), os.path.join(test_dir, "c", "link.bin"))
+        expected_total = sum(expected.values())
+        print(f"Created {4 * 10} files and a hard link in 4 directories under {test_dir}, "
+              f"total {expected_total} bytes")
+        
+        def sizes(root):
+            return (root.total, root.files, sorted((child.name, child.total) for child in root.children))
+        
+        expected_sizes = (expected_total, 10, [("a", expected["a"] + expected[os.path.join("a", "b")]),
+                                               ("c", expected["c"])])
+        test1_passed = True
+        print("\nChecking results:")
+        for name, scanner in (("threads", DirectoryScanner(jobs=4)),
+                              ("asyncio", AsyncDirectoryScanner(in_flight=8))):
+            got = sizes(scanner.scan(test_dir))
+            print(f"  - {name}: Expected {expected_sizes}, Got {got}")
+            if got != expected_sizes:
+                print(f"    ERROR: {name} sizes mismatch")
+                test1_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ {name} sizes correct")
+        
+        if test1_passed:
+            print("\nTEST 1: PASSED")
+        else:
+            print("\nTEST 1: FAILED")
+        
+        # Test 2: Calls that wait on the file system overlap
+        print("\n\nTEST 2: The asyncio scanner keeps calls in flight on a slow file system")
+        print("---------------------------------------------------------------------")
+        
+        latency = 0.01
+        fs = LatencyFileSystem(latency)
+        print(f"Scanning through a file system that waits {latency * 1000:.0f} ms on every call")
+        timings = {}
+        test2_passed = True
+        print("\nChecking results:")
+        for name, scanner in (("threads, 1 job", DirectoryScanner(jobs=1, fs=fs)),
+                              ("asyncio, 1 in flight", AsyncDirectoryScanner(in_flight=1, batch=1, fs=fs)),
+                              ("asyncio, 32 in flight", AsyncDirectoryScanner(in_flight=32, batch=1, fs=fs))):
+            started = time.perf_counter()
+            got = sizes(scanner.scan(test_dir))
+            timings[name] = time.perf_counter() - started
+            print(f"  - {name}: {timings[name]:.2f}s, Got {got}")
+            if got != expected_sizes:
+                print(f"    ERROR: {name} sizes mismatch")
+                test2_passed = False
+                all_tests_passed = False
+        
+        # 45 listing and stat calls in a row take at least 0.45s
+        speedup = timings["asyncio, 1 in flight"] / timings["asyncio, 32 in flight"]
+        print(f"  - Speedup of 32 calls in flight over 1: Expected at least 3x, Got {speedup:.1f}x")
+        if speedup < 3:
+            print(f"    ERROR: Calls don't overlap")
+            test2_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Calls overlap")
+        
+        if test2_passed:
+            print("\nTEST 2: PASSED")
+        else:
+            print("\nTEST 2: FAILED")
+        
+        # Test 3: Breakdown by extension and age
+        print("\n\nTEST 3: Files broken down by extension and age during the scan")
+        print("------------------------------------------------------------")
+        
+        now = time.time()
+        old = now - 2 * 365 * 86400
+        for name in os.listdir(os.path.join(test_dir, "c")):
+            os.utime(os.path.join(test_dir, "c", name), (old, old))
+        with open(os.path.join(test_dir, "a", "notes.TXT"), "wb") as f:
+            f.write(b"x" * 7)
+        print("Aged the files in c by 2 years and added a .TXT file to a")
+        
+        file_totals = Breakdown(["extension", "mtime"], now=now)
+        AsyncDirectoryScanner(in_flight=8, breakdown=file_totals).scan(test_dir)
+        expected_extensions = [(".bin", expected_total, 40), (".txt", 7, 1)]
+        expected_ages = [("< 1 day", expected_total - expected["c"] + 7, 31), ("< 3 years", expected["c"], 10)]
+        test3_passed = True
+        
+        print("\nChecking results:")
+        for field, expected_rows in (("extension", expected_extensions), ("mtime", expected_ages)):
+            rows = file_totals.totals(field)
+            print(f"  - By {field}: Expected {expected_rows}, Got {rows}")
+            if rows != expected_rows:
+                print(f"    ERROR: {field} totals mismatch")
+                test3_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ {field} totals correct")
+        
+        if test3_passed:
+            print("\nTEST 3: PASSED")
+        else:
+            print("\nTEST 3: FAILED")
+        
+        # Test 4: Several roots in one scan, and merged snapshots
+        print("\n\nTEST 4: Several roots scanned at once and their snapshots merged")
+        print("--------------------------------------------------------------")
+        
+        roots = [os.path.join(test_dir, "a"), os.path.join(test_dir, "c")]
+        trees = DirectoryScanner(jobs=4).scan_roots(roots)
+        expected_totals = [DirectoryScanner(jobs=1).scan(root).total for root in roots]
+        got_totals = [tree.total for tree in trees]
+        test4_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - Totals of a and c: Expected {expected_totals}, Got {got_totals}")
+        if got_totals != expected_totals:
+            print(f"    ERROR: Totals differ from separate scans")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Totals match separate scans")
+        
+        snapshots = []
+        for i, (root, tree) in enumerate(zip(roots, trees)):
+            snapshot = Snapshot(os.path.join(test_dir, f"snapshot{i}.db"))
+            snapshot.save(root, {}, time.time_ns(), tree)
+            snapshots.append(snapshot)
+        merged = [(path, total, sources) for path, _, _, total, _, sources in merge_directories(snapshots)]
+        for snapshot in snapshots:
+            snapshot.close()
+        expected_merged = [("", sum(expected_totals), 2), ("b", trees[0].children[0].total, 1)]
+        print(f"  - Merged snapshots: Expected {expected_merged}, Got {merged}")
+        if merged != expected_merged:
+            print(f"    ERROR: Merged tree mismatch")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Merged tree correct")
+        
+        # A snapshot of an older dua.py is refused, and left as it is
+        older = os.path.join(test_dir, "older.db")
+        with contextlib.closing(sqlite3.connect(older)) as conn:
+            conn.execute("CREATE TABLE scan (root TEXT, options TEXT, started INTEGER)")
+            conn.execute("INSERT INTO scan VALUES (?, '{}', 0)", (roots[0],))
+            conn.execute("PRAGMA user_version = 2")
+            conn.commit()
+        with open(older, "rb") as f:
+            before = f.read()
+        merged_older = merge_snapshots([os.path.join(test_dir, "snapshot0.db"), older])
+        with open(older, "rb") as f:
+            unchanged = f.read() == before
+        print(f"  - Merging an older snapshot: Expected refused and unchanged, "
+              f"Got {'merged' if merged_older else 'refused'} and {'unchanged' if unchanged else 'changed'}")
+        if merged_older or not unchanged:
+            print(f"    ERROR: Merging must not migrate its inputs")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Older snapshot refused and left unchanged")
+        
+        if test4_passed:
+            print("\nTEST 4: PASSED")
+        else:
+            print("\nTEST 4: FAILED")
+        
+        # Test 5: Incremental rescans
+        print("\n\nTEST 5: A rescan against a snapshot lists only what changed and sizes like a full scan")
+        print("-------------------------------------------------------------------------------------")
+        
+        root = os.path.join(test_dir, "incremental")
+        files = {"keep/file": 100, "add/file": 10, "remove/first": 20, "remove/second": 30,
+                 "parent/file": 40, "links_a/big": 5000}
+        for name, size in files.items():
+            os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(root, name), "wb") as f:
+                f.write(b"x" * size)
+        os.makedirs(os.path.join(root, "links_b"))
+        os.link(os.path.join(root, "links_a", "big"), os.path.join(root, "links_b", "link"))
+        # Old enough for the rescan to trust the mtimes
+        old = time.time() - 100
+        for directory in ("", "keep", "add", "remove", "parent", "links_a", "links_b"):
+            os.utime(os.path.join(root, directory), (old, old))
+        started = time.time_ns()
+        snapshot = Snapshot(os.path.join(test_dir, "incremental.db"))
+        snapshot.save(root, {}, started, DirectoryScanner(jobs=4, track_mtimes=True).scan(root))
+        previous = snapshot.load()[3]
+        snapshot.close()
+        print(f"Scanned {len(files)} files and a hard link in 6 directories and stored the snapshot")
+        
+        with open(os.path.join(root, "add", "new"), "wb") as f:
+            f.write(b"x" * 7)
+        os.remove(os.path.join(root, "remove", "first"))
+        os.makedirs(os.path.join(root, "parent", "new"))
+        with open(os.path.join(root, "parent", "new", "file"), "wb") as f:
+            f.write(b"x" * 3)
+        # Only the directory whose link wasn't counted changes, the other one
+        # would be reused with the link counted
+        uncounted = min(("links_a", "links_b"), key=lambda name: next(
+            child.total for child in previous.children if child.name == name))
+        with open(os.path.join(root, uncounted, "other"), "wb") as f:
+            f.write(b"x")
+        print("Added a file, removed one, made a directory and added a file next to the hard link")
+        
+        listed = []
+        class CountingFileSystem(LocalFileSystem):
+            @staticmethod
+            def scandir(path):
+                listed.append(os.path.relpath(path, root))
+                return os.scandir(path)
+        
+        rescanned = DirectoryScanner(jobs=4, track_mtimes=True, fs=CountingFileSystem).scan(root, previous, started)
+        full = DirectoryScanner(jobs=4, track_mtimes=True).scan(root)
+        def sizes(tree):
+            totals = {child.name: child.total for child in tree.children}
+            # Which directory counts the linked file depends on the scan order
+            totals["links_a + links_b"] = totals.pop("links_a") + totals.pop("links_b")
+            return sorted(totals.items())
+        got_sizes = sizes(rescanned)
+        expected_sizes = sizes(full)
+        expected_listed = ["add", "links_a", "links_b", "parent", os.path.join("parent", "new"), "remove"]
+        test5_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - Total: Expected {full.total} (a full scan, the hard link once), Got {rescanned.total}")
+        print(f"  - Directories: Expected {expected_sizes}, Got {got_sizes}")
+        if rescanned.total != full.total or got_sizes != expected_sizes:
+            print(f"    ERROR: The rescan sizes differ from a full scan")
+            test5_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Sizes match a full scan")
+        print(f"  - Listed: Expected {expected_listed}, Got {sorted(listed)}")
+        if sorted(listed) != expected_listed:
+            print(f"    ERROR: Only changed directories and those with hard links should be listed")
+            test5_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Unchanged directories reused")
+        
+        if test5_passed:
+            print("\nTEST 5: PASSED")
+        else:
+            print("\nTEST 5: FAILED")
+        
+        # Test 6: Streamed exports
+        print("\n\nTEST 6: The ndjson and ncdu exports hold the whole tree, hard links included")
+        print("---------------------------------------------------------------------------")
+        
+        root = os.path.join(test_dir, "export")
+        for name, size in (("a/file", 100), ("a/big", 5000), ("c/d/file", 10)):
+            os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(root, name), "wb") as f:
+                f.write(b"x" * size)
+        os.makedirs(os.path.join(root, "b"))
+        os.link(os.path.join(root, "a", "big"), os.path.join(root, "b", "link"))
+        print("Created 3 files in 4 directories and a hard link to one of them")
+        
+        def export(exporter_class, out):
+            exporter = exporter_class({root: "export"}, out)
+            exporter.start()
+            result = []
+            # A writer that fails must not keep the scan from ending
+            scan = threading.Thread(target=lambda: result.append(scan_tree(root, jobs=4, exporter=exporter)),
+                                    daemon=True)
+            scan.start()
+            scan.join(10)
+            if scan.is_alive():
+                return None, exporter
+            exporter.finish()
+            return result[0], exporter
+        
+        test6_passed = True
+        print("\nChecking results:")
+        out = io.StringIO()
+        tree, _ = export(NdjsonExporter, out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        got_paths = sorted(record["path"] for record in records if record["type"] == "directory")
+        expected_paths = sorted(os.path.join("export", *path) for path in ((), ("a",), ("b",), ("c",), ("c", "d")))
+        summaries = [(record["total"], record["files"]) for record in records if record["type"] == "summary"]
+        print(f"  - ndjson: Expected {expected_paths} and summary [(5110, 3)], Got {got_paths} and {summaries}")
+        if got_paths != expected_paths or summaries != [(5110, 3)]:
+            print(f"    ERROR: ndjson records mismatch")
+            test6_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ ndjson records correct")
+        
+        out = io.StringIO()
+        export(NcduExporter, out)
+        _, _, _, exported_root = json.loads(out.getvalue())
+        files = {}
+        def collect(directory, path):
+            for item in directory[1:]:
+                if isinstance(item, list):
+                    collect(item, path + [item[0]["name"]])
+                else:
+                    files["/".join(path + [item["name"]])] = item
+        collect(exported_root, [])
+        linked = [files.get(name, {}) for name in ("a/big", "b/link")]
+        unique_size = sum(item["asize"] for item in files.values() if "ino" not in item) + \
+            sum({item["ino"]: item["asize"] for item in files.values() if "ino" in item}.values())
+        print(f"  - ncdu: Expected a/big and b/link with one inode, 5110 bytes, Got {sorted(files)}, {unique_size} bytes")
+        if sorted(files) != ["a/big", "a/file", "b/link", "c/d/file"] or unique_size != 5110 or \
+                not all(item.get("hlnkc") for item in linked) or linked[0]["ino"] != linked[1]["ino"]:
+            print(f"    ERROR: ncdu export mismatch")
+            test6_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ ncdu export correct, both links marked")
+        
+        class BrokenPipe(io.StringIO):
+            def write(self, text):
+                raise BrokenPipeError(32, "Broken pipe")
+        tree, exporter = export(NcduExporter, BrokenPipe())
+        got = "hung" if tree is None else (tree.total, type(exporter.error).__name__)
+        print(f"  - Reader gone: Expected (5110, 'BrokenPipeError'), Got {got}")
+        if got != (5110, "BrokenPipeError"):
+            print(f"    ERROR: The scan must end and keep the error")
+            test6_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Scan ended, error kept")
+        
+        if test6_passed:
+            print("\nTEST 6: PASSED")
+        else:
+            print("\nTEST 6: FAILED")
+        
+        # Test 7: --top
+        print("\n\nTEST 7: --top keeps the largest files and directories, ties included")
+        print("-------------------------------------------------------------------")
+        
+        root = os.path.join(test_dir, "top")
+        for name, size in (("big/f1", 1000), ("big/f2", 900), ("mid/g", 500), ("mid/h", 500),
+                           ("mid/sub/k", 500), ("small/s", 500)):
+            os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(root, name), "wb") as f:
+                f.write(b"x" * size)
+        print("Created 6 files, four of 500 bytes, in 4 directories")
+        
+        def ranked(entries):
+            return [(size, os.path.relpath(path, root).replace(os.sep, "/")) for size, path in entries]
+        
+        expected_files = [(1000, "big/f1"), (900, "big/f2")]
+        expected_dirs = [(1900, "big"), (1500, "mid")]
+        tied_files = ["mid/g", "mid/h", "mid/sub/k", "small/s"]
+        tied_dirs = ["mid/sub", "small"]
+        test7_passed = True
+        print("\nChecking results:")
+        for name, scanner_class, options in (("threads", DirectoryScanner, {"jobs": 4}),
+                                             ("asyncio", AsyncDirectoryScanner, {"in_flight": 8})):
+            for n in (3, 10):
+                top_entries = TopEntries(n)
+                scanner_class(top=top_entries, **options).scan(root)
+                files, dirs = ranked(top_entries.files()), ranked(top_entries.directories())
+                # Which of equally large entries make the cut depends on the scan order
+                ok = True
+                for got, expected, tied in ((files, expected_files, tied_files), (dirs, expected_dirs, tied_dirs)):
+                    ok = ok and got[:2] == expected and len(got) == min(n, 2 + len(tied)) and \
+                        len(set(got)) == len(got) and all(size == 500 and path in tied for size, path in got[2:])
+                print(f"  - {name}, top {n}: Got files {files}, directories {dirs}")
+                if not ok:
+                    print(f"    ERROR: Expected {expected_files} and {expected_dirs} first, "
+                          f"then {tied_files} and {tied_dirs} at 500 bytes up to {n}")
+                    test7_passed = False
+                    all_tests_passed = False
+                else:
+                    print(f"    ✓ Largest first, ties kept up to the cut")
+        
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--top", "0", root],
+                                capture_output=True, text=True)
+        print(f"  - --top 0: Expected no largest entries, Got exit code {result.returncode}, "
+              f"{result.stdout.count('Largest')} tables")
+        if result.returncode != 0 or "Largest" in result.stdout:
+            print(f"    ERROR: --top 0 should turn the tables off")
+            test7_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ No tables")
+        
+        if test7_passed:
+            print("\nTEST 7: PASSED")
+        else:
+            print("\nTEST 7: FAILED")
+        
+        # Test 8: A worker's unexpected exception
+        print("\n\nTEST 8: An unexpected exception in a worker ends the scan and is raised")
+        print("---------------------------------------------------------------------")
+        
+        failing = os.path.join(test_dir, "a", "b")
+        class FailingFileSystem(LocalFileSystem):
+            @staticmethod
+            def scandir(path):
+                if path == failing:
+                    raise RuntimeError(f"can't list {path}")
+                return os.scandir(path)
+        print(f"Scanning through a file system that raises RuntimeError listing {failing}")
+        
+        test8_passed = True
+        print("\nChecking results:")
+        for name, scanner in (("threads", DirectoryScanner(jobs=4, fs=FailingFileSystem)),
+                              ("asyncio", AsyncDirectoryScanner(in_flight=8, fs=FailingFileSystem))):
+            raised = []
+            def scan(scanner=scanner):
+                try:
+                    scanner.scan(test_dir)
+                except Exception as e:
+                    raised.append(e)
+            thread = threading.Thread(target=scan, daemon=True)
+            thread.start()
+            thread.join(10)
+            got = "hung" if thread.is_alive() else [type(e).__name__ for e in raised]
+            print(f"  - {name}: Expected ['RuntimeError'], Got {got}")
+            if got != ["RuntimeError"]:
+                print(f"    ERROR: The scan should end and raise the worker's exception")
+                test8_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ Scan ended and raised")
+        
+        if test8_passed:
+            print("\nTEST 8: PASSED")
+        else:
+            print("\nTEST 8: FAILED")
+    
+    finally:
+        shutil.rmtree(test_dir)
+        print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Summary
+    print("\n======================")
+    if all_tests_passed:
+        print("All tests PASSED!")
+    else:
+        print("Some tests FAILED!")
+    print("======================")
+    
+    return all_tests_passed
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "merge":
+        sys.exit(0 if merge_snapshots(args.snapshots, args.output) else 1)
+    if args.test:
+        sys.exit(0 if run_tests() else 1)
+    backend_options = {"in_flight": args.in_flight} if args.backend == "asyncio" else {}
+    scan_directory(args.paths if len(args.paths) > 1 else args.paths[0], args.jobs or None,
+                   snapshot=args.snapshot, diff=args.diff,
+                   interactive=args.interactive, top=args.top, output=args.output,
+                   breakdown=list(dict.fromkeys(args.by)),
+                   backend=args.backend, disk_usage=args.disk_usage,
+                   one_file_system=args.one_file_system, count_links=args.count_links,
+                   largest_files=args.largest_files, **backend_options)
@@ -0,0 +1,50 @@
+"""
+Directory walking used by loc.py and loc_bench.py.
+
+The walk is iterative (an explicit stack instead of recursion) and built on
+os.scandir, so entry types come from the cached DirEntry information instead
+of separate isdir/isfile stat calls.
+"""
+
+import os
+
+
+def walk(root, skip_dir=None, onerror=None):
+    """
+    Walk the tree below root depth-first, one directory listing at a time.
+
+    Args:
+        root: Directory to walk
+        skip_dir: Optional callable taking a directory DirEntry; directories
+            for which it returns True are neither yielded nor descended into
+        onerror: Optional callable receiving the OSError raised when a
+            directory can't be listed
+
+    Yields:
+        (top, entry) for every file and directory below root, where entry is
+        an os.DirEntry and top is the name of the first level directory the
+        entry is in, or None for entries directly inside root.
+        Symlinked directories are yielded but not followed.
+    """
+    stack = [(root, None)]
+    while stack:
+        path, top = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(path) as scanner:
+                for entry in scanner:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if skip_dir is not None and skip_dir(entry):
+                            continue
+                        subdirs.append((entry.path, entry.name if top is None else top))
+                    yield top, entry
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+
+        # Reversed so subdirectories are visited in listing order
+        stack.extend(reversed(subdirs))
@@ -1,15 +1,589 @@
 #!/usr/bin/env python3
 
+import argparse
+import codecs
+import concurrent.futures
+import csv
+import ctypes
+import itertools
+import json
+import operator
 import os
+import re
+import select
+import sqlite3
+import struct
 import sys
-from collections import defaultdict
+import time
+from collections import defaultdict, namedtuple
+
+import fswalk
+
+DEFAULT_BATCH_SIZE = 256
+
+# Returned by LineCountCache.lookup when a file has to be (re)counted
+CACHE_MISS = object()
+
+
+# Byte classes used by count_file_lines. Every character that str.splitlines()
+# breaks on becomes a newline, whitespace that str.strip() removes is deleted
+# and all other bytes become 'x', so a non-blank line ends in b'x\n'.
+_LINE_BREAKS = b'\n\r\x0b\x0c\x1c\x1d\x1e'
+_BLANKS = b' \t\x1f'
+_CLASSIFY = bytes(ord('\n') if b in _LINE_BREAKS else ord('x') for b in range(256))
+_UNICODE_LINE_BREAKS = re.compile(rb'\xc2\x85|\xe2\x80[\xa8\xa9]')
+_UNICODE_BLANKS = re.compile(rb'\xc2\xa0|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xaf]|\xe2\x81\x9f|\xe3\x80\x80')
+# Leading bytes of every multi-byte sequence matched by the two patterns above
+_UNICODE_WHITESPACE_LEADS = (b'\xc2', b'\xe2', b'\xe1\x9a\x80', b'\xe3\x80\x80')
+
+CHUNK_SIZE = 1 << 20
+
+
+def count_file_lines(file_path):
+    """
+    Count the non-blank lines of a single file.
+    
+    The file is read in fixed-size binary chunks and classified with
+    bytes.translate, so memory use is constant and no per-line objects are
+    created. Lines are split and stripped exactly like str.splitlines() and
+    str.strip() would, and files that aren't valid UTF-8 are skipped.
+
+    Args:
+        file_path: Path to the file to count
+
+    Returns:
+        Number of non-blank lines, or None if the file can't be read
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            lines_count = 0
+            in_line = False
+            carry = b''
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                # ASCII is valid UTF-8; anything else is validated and
+                # multi-byte line breaks and whitespace are folded to ASCII
+                if carry or not chunk.isascii():
+                    chunk = carry + chunk
+                    _, consumed = codecs.utf_8_decode(chunk, 'strict', False)
+                    chunk, carry = chunk[:consumed], chunk[consumed:]
+                    if any(lead in chunk for lead in _UNICODE_WHITESPACE_LEADS):
+                        chunk = _UNICODE_LINE_BREAKS.sub(b'\n', chunk)
+                        chunk = _UNICODE_BLANKS.sub(b'', chunk)
+                
+                classified = chunk.translate(_CLASSIFY, _BLANKS)
+                if not classified:
+                    continue
+                lines_count += classified.count(b'x\n')
+                
+                # A non-blank line that crosses the chunk boundary
+                if in_line and classified[0] == ord('\n'):
+                    lines_count += 1
+                in_line = classified[-1] == ord('x')
+            
+            if carry:
+                # Truncated UTF-8 sequence at the end of the file
+                return None
+            return lines_count + in_line
+    except Exception:
+        return None
+
+
+# Per-file result of language-aware counting. code + comments equals the
+# non-blank line count returned by count_file_lines.
+FileStats = namedtuple('FileStats', ['code', 'comments', 'blanks'])
+
+# Regex class of the line breaks in _LINE_BREAKS
+_BREAK_CLASS = rb'\n\r\x0b\x0c\x1c\x1d\x1e'
+_FIRST_BREAK = re.compile(b'[' + _BREAK_CLASS + b']')
+
+
+def _body(end, escapes, single_line):
+    """
+    Pattern for the text up to (not including) an end delimiter, unrolled
+    so the regex engine consumes runs of ordinary characters in one step.
+    Backslash escapes are skipped when escapes is set.
+    """
+    first, rest = re.escape(end[:1]), re.escape(end[1:])
+    excluded = first + (rb'\\' if escapes else b'') + (_BREAK_CLASS if single_line else b'')
+    plain = b'[^' + excluded + b']*'
+    special = [first + b'(?!' + rest + b')'] if rest else []
+    if escapes:
+        special.append(rb'\\' + (b'[^' + _BREAK_CLASS + b']?' if single_line else rb'[\s\S]'))
+    if not special:
+        return plain
+    return plain + b'(?:(?:' + b'|'.join(special) + b')' + plain + b')*'
+
+
+def _comment_span(start, end, escapes, group):
+    """
+    Pattern for a comment that may span lines, up to its end delimiter or the
+    end of the file. When it does span lines, the first line break is
+    captured in group so it survives the split.
+    """
+    end_pattern = re.escape(end)
+    return (start + _body(end, escapes, True) +
+            b'(?:' + end_pattern + b'|(?P<' + group + b'>[' + _BREAK_CLASS + b'])' +
+            _body(end, escapes, False) + b'(?:' + end_pattern + rb'|\Z))')
+
+
+class Language:
+    """
+    Comment and string syntax of a language, compiled into a single pattern
+    that finds every comment and string literal in one scan.
+    
+    Comments are removed by splitting on the pattern: the captured string
+    text is kept, comments keep at most one line break. Every alternative
+    starts with a literal, which lets the regex engine skip ahead to the
+    next candidate character instead of trying every position.
+    
+    Args:
+        name: Display name of the language
+        line_comments: Tokens that start a comment running to the end of the line
+        block_comments: (start, end) token pairs of comments that can span lines
+        strings: Quote characters of single-line string literals
+        multiline_strings: Delimiters of string literals that can span lines
+        docstrings: Whether multi-line strings that start a line are comments
+        docstring_prefixes: String prefixes such as r or u allowed on docstrings
+    """
+    def __init__(self, name, line_comments=(), block_comments=(), strings=('"', "'"),
+                 multiline_strings=(), docstrings=False, docstring_prefixes=''):
+        self.name = name
+        self.docstring_prefixes = docstring_prefixes.encode()
+        self.docstring_groups = []
+        # Tokens that start a comment; a file with none of them has none
+        self.comment_starts = tuple(token.encode() for token in line_comments)
+        self.comment_starts += tuple(start.encode() for start, _ in block_comments)
+        if docstrings:
+            self.comment_starts += tuple(d.encode() for d in multiline_strings)
+        alternatives = []
+        groups = []
+        
+        def group(kind):
+            groups.append(kind)
+            return f'{kind}{len(groups)}'.encode()
+        
+        for d in multiline_strings:
+            delimiter = d.encode()
+            alternatives.append(re.escape(delimiter) + b'(?P<' + group('str') + b'>' +
+                                _body(delimiter, True, False) + b'(?:' + re.escape(delimiter) + rb'|\Z))')
+            if docstrings:
+                self.docstring_groups.append(len(groups))
+        for q in strings:
+            quote = q.encode()
+            alternatives.append(re.escape(quote) + b'(?P<' + group('str') + b'>' +
+                                _body(quote, True, True) + re.escape(quote) + b')')
+        for token in line_comments:
+            alternatives.append(re.escape(token.encode()) + b'[^' + _BREAK_CLASS + b']*')
+        for start, end in block_comments:
+            alternatives.append(_comment_span(re.escape(start.encode()), end.encode(), False, group('com')))
+        
+        self.pattern = re.compile(b'|'.join(alternatives)) if alternatives else None
+    
+    def strip_comments(self, data):
+        """
+        Return data with every comment removed. Lines of code keep their
+        text and line breaks; each comment leaves at most one line break.
+        data itself is returned when it holds no comment start token.
+        """
+        if self.pattern is None or not any(start in data for start in self.comment_starts):
+            return data
+        parts = self.pattern.split(data)
+        if self.docstring_groups:
+            self._strip_docstrings(parts)
+        return b"".join(filter(None, parts))
+    
+    def _strip_docstrings(self, parts):
+        """
+        Turn the multi-line strings in split output that start a line into
+        comments. Only the few string matches are visited, so docstrings
+        cost nothing per line.
+        """
+        # split() returns the text before each match followed by its groups
+        stride = self.pattern.groups + 1
+        for group in self.docstring_groups:
+            matches = parts[group::stride]
+            found = map(operator.is_not, matches, itertools.repeat(None))
+            for i in itertools.compress(range(len(matches)), found):
+                text = matches[i]
+                before = i * stride
+                code = parts[before].rstrip(self.docstring_prefixes)
+                line = code.rstrip(b' \t')
+                if line:
+                    if line[-1] not in _LINE_BREAKS:
+                        continue
+                elif i:
+                    # Straight after another string or comment
+                    continue
+                parts[before] = code
+                line_break = _FIRST_BREAK.search(text)
+                parts[before + group] = line_break[0] if line_break else None
+
+
+_C_LIKE = dict(line_comments=('//',), block_comments=(('/*', '*/'),))
+
+LANGUAGES = {
+    '.ts': Language('TypeScript', multiline_strings=('`',), **_C_LIKE),
+    '.tsx': Language('TypeScript', multiline_strings=('`',), **_C_LIKE),
+    '.js': Language('JavaScript', multiline_strings=('`',), **_C_LIKE),
+    '.jsx': Language('JavaScript', multiline_strings=('`',), **_C_LIKE),
+    '.html': Language('HTML', block_comments=(('<!--', '-->'),), strings=()),
+    '.css': Language('CSS', block_comments=(('/*', '*/'),)),
+    '.cs': Language('C#', **_C_LIKE),
+    '.c': Language('C', **_C_LIKE),
+    '.cpp': Language('C++', **_C_LIKE),
+    '.h': Language('C/C++ Header', **_C_LIKE),
+    '.py': Language('Python', line_comments=('#',), multiline_strings=('"""', "'''"),
+                    docstrings=True, docstring_prefixes='rRuU'),
+}
+
+
+def count_file_stats(file_path, language=None):
+    """
+    Split the lines of a single file into code, comment and blank lines.
+    
+    Lines and whitespace follow the same rules as count_file_lines. A line
+    with both code and a comment counts as code. Comments and strings can
+    span lines, so the whole file is read at once.
+
+    Args:
+        file_path: Path to the file to count
+        language: Language of the file; without one every non-blank line is code
+
+    Returns:
+        FileStats, or None if the file can't be read
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        # A CRLF pair is a single line break. They are counted before the
+        # Unicode breaks become b'\n', which would pair them with a b'\r'
+        crlf = data.count(b'\r\n') if b'\r' in data else 0
+        if not data.isascii():
+            codecs.utf_8_decode(data, 'strict', True)
+            if any(lead in data for lead in _UNICODE_WHITESPACE_LEADS):
+                data = _UNICODE_LINE_BREAKS.sub(b'\n', data)
+                data = _UNICODE_BLANKS.sub(b' ', data)
+    except Exception:
+        return None
+    
+    # Non-blank lines start with an 'x'. b'\nx' is counted rather than
+    # b'x\n': the search skips ahead faster on the rarer first byte
+    classified = data.translate(_CLASSIFY, _BLANKS)
+    non_blank = classified.count(b'\nx') + classified.startswith(b'x')
+    
+    total = classified.count(b'\n') - crlf
+    if data and data[-1] not in _LINE_BREAKS:
+        total += 1
+    
+    code_only = language.strip_comments(data) if language is not None else data
+    if code_only is data:
+        code = non_blank
+    else:
+        code_only = code_only.translate(_CLASSIFY, _BLANKS)
+        code = code_only.count(b'\nx') + code_only.startswith(b'x')
+    
+    return FileStats(code, non_blank - code, total - non_blank)
+
+
+def count_file(file_path, ext, languages=None):
+    """Count a file with count_file_stats when a language table is given,
+    otherwise with count_file_lines."""
+    if languages is None:
+        return count_file_lines(file_path)
+    return count_file_stats(file_path, languages.get(ext))
+
+
+_worker_languages = None
+
+
+def _init_worker(languages):
+    """Pool initializer: the language table is sent to each worker once."""
+    global _worker_languages
+    _worker_languages = languages
+
+
+def _count_batch(files):
+    """Worker entry point: count a batch of (path, extension) pairs in a pool process."""
+    return [count_file(path, ext, _worker_languages) for path, ext in files]
+
+
+def find_git_repository(path):
+    """
+    Find the repository containing path.
+    
+    Returns:
+        (work tree root, git directory) tuple, or None outside a repository
+    """
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            # Worktrees and submodules have a .git file pointing to the git dir
+            with open(dot_git, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                return path, os.path.join(path, content[len('gitdir:'):].strip())
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _git_hash_size(git_dir):
+    """Object id length in bytes: 32 for SHA-256 repositories, 20 otherwise."""
+    try:
+        with open(os.path.join(git_dir, 'config'), 'r', encoding='utf-8') as f:
+            config = f.read().lower()
+    except OSError:
+        return 20
+    return 32 if re.search(r'objectformat\s*=\s*sha256', config) else 20
+
+
+def read_git_index(git_dir):
+    """
+    Read the paths of tracked files straight from a git index file.
+    
+    Supports index versions 2 to 4. Submodules and sparse directory entries
+    are skipped and conflicted paths are reported once.
+    
+    Args:
+        git_dir: Path to the repository's git directory
+        
+    Returns:
+        List of '/'-separated paths relative to the work tree, in index order
+    """
+    with open(os.path.join(git_dir, 'index'), 'rb') as f:
+        data = f.read()
+    
+    signature, version, entry_count = struct.unpack_from('>4sLL', data)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise ValueError(f"Unsupported git index in '{git_dir}' (version {version})")
+    
+    hash_size = _git_hash_size(git_dir)
+    paths = []
+    previous = b''
+    offset = 12
+    for _ in range(entry_count):
+        # ctime, mtime, dev, ino, mode, uid, gid, size, object id, flags
+        mode = struct.unpack_from('>L', data, offset + 24)[0]
+        flags = struct.unpack_from('>H', data, offset + 40 + hash_size)[0]
+        header_size = 40 + hash_size + 2
+        if version >= 3 and flags & 0x4000:
+            header_size += 2
+        
+        position = offset + header_size
+        if version == 4:
+            # Path is prefix compressed against the previous entry
+            strip = data[position] & 0x7f
+            while data[position] & 0x80:
+                position += 1
+                strip = ((strip + 1) << 7) | (data[position] & 0x7f)
+            position += 1
+            end = data.index(b'\0', position)
+            name = previous[:len(previous) - strip] + data[position:end]
+            offset = end + 1
+        else:
+            # Entries are NUL padded to a multiple of 8 bytes
+            end = data.index(b'\0', position)
+            name = data[position:end]
+            offset += (header_size + len(name) + 8) & ~7
+        
+        file_type = mode & 0o170000
+        if name != previous and file_type in (0o100000, 0o120000):
+            paths.append(name.decode('utf-8', 'surrogateescape'))
+        previous = name
+    
+    return paths
+
+
+def default_cache_path():
+    """Location of the line count cache, following the XDG base directory spec."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'loc', 'cache.sqlite')
+
+
+class LineCountCache:
+    """
+    Persistent per-file line counts keyed on (path, mtime, size, inode).
+    Files counted with a language table also keep their code, comment and
+    blank line split.
+    
+    Entries below the scanned root are loaded into memory up front, so a
+    lookup costs one stat call and no file reads. Call save() after a
+    complete scan to write new counts and evict entries for files that
+    were not seen, e.g. because they were deleted.
+    
+    Paths are stored as os.fsencode BLOBs, so names that aren't valid
+    UTF-8 are cached like any other.
+    """
+    SCHEMA_VERSION = 3
+    
+    def __init__(self, db_path, root, rebuild=False):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path BLOB PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER, lines INTEGER, "
+            "code INTEGER, comments INTEGER, blanks INTEGER)"
+        )
+        
+        # Only entries below the root are loaded and eligible for eviction
+        self.prefix = os.fsencode(os.path.join(os.path.abspath(root), ''))
+        self._prefix_end = self.prefix[:-1] + bytes([self.prefix[-1] + 1])
+        if rebuild:
+            self.conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (self.prefix, self._prefix_end))
+            self.entries = {}
+        else:
+            rows = self.conn.execute(
+                "SELECT path, mtime_ns, size, inode, lines, code, comments, blanks FROM files "
+                "WHERE path >= ? AND path < ?",
+                (self.prefix, self._prefix_end),
+            )
+            self.entries = {os.fsdecode(row[0]): row[1:] for row in rows}
+        
+        self.seen = set()
+        self.pending = {}
+        self.updates = []
+    
+    def lookup(self, path, stat_result, detailed=False):
+        """
+        Return the cached result for an absolute path, or CACHE_MISS.
+        
+        The result is a line count, or FileStats when detailed is set.
+        Files that couldn't be read are cached as None.
+        """
+        self.seen.add(path)
+        key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+        cached = self.entries.get(path)
+        if cached is not None and cached[:3] == key:
+            lines, code, comments, blanks = cached[3:]
+            if lines is None or not detailed:
+                return lines
+            if code is not None:
+                return FileStats(code, comments, blanks)
+        self.pending[path] = key
+        return CACHE_MISS
+    
+    def store(self, path, result):
+        """Record the result of a file previously reported as a miss."""
+        if isinstance(result, FileStats):
+            counts = (result.code + result.comments, *result)
+        else:
+            counts = (result, None, None, None)
+        self.updates.append((os.fsencode(path), *self.pending.pop(path), *counts))
+    
+    def save(self):
+        """Write new counts and evict entries for files that weren't seen."""
+        stale = [(os.fsencode(path),) for path in self.entries.keys() - self.seen]
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", stale)
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.updates)
+        self.updates = []
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DirectoryNode:
+    """
+    Line total of a directory and everything below it, in a prefix tree of
+    the directories that hold counted files. children maps subdirectory
+    names to their nodes.
+    """
+    __slots__ = ('lines', 'children')
+    
+    def __init__(self):
+        self.lines = 0
+        self.children = {}
+    
+    def add(self, parts, lines):
+        """Add lines to this node and every node on the path of parts below it."""
+        node = self
+        node.lines += lines
+        for part in parts:
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = DirectoryNode()
+            child.lines += lines
+            node = child
+    
+    def find(self, path):
+        """Return the node of a '/' separated path below this one, or None."""
+        node = self
+        for part in path.split('/'):
+            if part in ('', '.'):
+                continue
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+    
+    def lines_under(self, path):
+        """Total lines below a '/' separated path, 0 if nothing was counted there."""
+        node = self.find(path)
+        return node.lines if node is not None else 0
+    
+    def own_lines(self):
+        """Lines in files directly inside this directory."""
+        return self.lines - sum(child.lines for child in self.children.values())
+    
+    def walk(self, max_depth):
+        """
+        Yield (path, lines, depth) for the directories up to max_depth levels
+        below this one, depth first. Siblings come largest first, ties in name
+        order, so the output doesn't depend on directory listing order.
+        """
+        stack = [('', self, 0)]
+        while stack:
+            path, node, depth = stack.pop()
+            if depth:
+                yield path, node.lines, depth
+            if depth < max_depth:
+                children = sorted(node.children.items(), key=lambda x: (-x[1].lines, x[0]))
+                stack.extend((f'{path}/{name}' if path else name, child, depth + 1)
+                             for name, child in reversed(children))
+
 
 class LineCounter:
-    def __init__(self, extensions, ignore_directories):
+    def __init__(self, extensions, ignore_directories, jobs=1, batch_size=DEFAULT_BATCH_SIZE, cache=None,
+                 git_index=False, languages=None, on_file=None, keep_files=False):
         self.extensions = extensions
         self.ignore_directories = ignore_directories
+        self.git_index = git_index
+        self.languages = languages
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.cache = cache
+        # Called with (path, extension, count) for every counted file
+        self.on_file = on_file
         self.lines_by_directory = defaultdict(int)
         self.lines_by_extension = defaultdict(int)
+        # Totals of every directory with counted files, see DirectoryNode
+        self.directory_tree = DirectoryNode()
+        # [code, comments, blanks] per extension, only filled with a language table
+        self.stats_by_extension = defaultdict(lambda: [0, 0, 0])
+        # path -> (extension, directory, count) of every counted file with
+        # keep_files, so update_files can adjust the totals later
+        self.files = {} if keep_files else None
+        self.root = None
 
     def count_lines_in_directory(self, directory_path):
         if not directory_path or not isinstance(directory_path, str):
@@ -22,141 +596,708 @@ class LineCounter:
         
         return total_lines, self.lines_by_extension, self.lines_by_directory
     
-    def _process_directory(self, directory_path, base_dir=None):
+    def _process_directory(self, directory_path):
         """
-        Process a directory and count lines in files and subdirectories.
+        Count lines in all matching files below a directory.
+        
+        Files are discovered by _walk_files and counted either in this
+        process or, when jobs > 1, in a pool of worker processes. With a
+        cache, only files whose stat metadata changed are counted. With a
+        language table, lines are also split into code, comments and blanks.
+        Each counted file is passed to on_file as soon as its count is known.
         
         Args:
             directory_path: Path to the directory to process
-            base_dir: Base directory path for calculating relative paths
             
         Returns:
             Total number of lines in this directory and its subdirectories
         """
-        if base_dir is None:
-            base_dir = directory_path
-            
+        if self.cache is not None:
+            # Cache entries are keyed on absolute paths
+            directory_path = os.path.abspath(directory_path)
+        self.root = directory_path
+        
+        top_dirs = []
+        if self.git_index:
+            files = self._git_index_files(directory_path, top_dirs)
+        else:
+            files = self._walk_files(directory_path, top_dirs)
+        
+        # (item, lines) pairs, where lines is CACHE_MISS for files to count
+        if self.cache is not None:
+            files = self._lookup_cached(files)
+        else:
+            files = ((item, CACHE_MISS) for item in files)
+        
+        # Cache hits pass through as they're found, so results stream in bounded memory
+        if self.jobs > 1:
+            results = self._count_parallel(files, self.cache)
+        else:
+            results = self._count_serial(files, self.cache)
+        
         total_lines = 0
-        first_level_dirs = {}
+        lines_by_path = {}
+        for (path, ext, dir_path), lines_count in results:
+            if lines_count is None:
+                # Skip files that can't be read
+                continue
+            if self.on_file is not None:
+                self.on_file(path, ext, lines_count)
+            if self.files is not None:
+                self.files[path] = (ext, dir_path, lines_count)
+            if self.languages is not None:
+                stats = self.stats_by_extension[ext]
+                for i, count in enumerate(lines_count):
+                    stats[i] += count
+                lines_count = lines_count.code + lines_count.comments
+            total_lines += lines_count
+            self.lines_by_extension[ext] += lines_count
+            lines_by_path[dir_path] = lines_by_path.get(dir_path, 0) + lines_count
         
-        try:
-            for item in os.listdir(directory_path):
-                full_path = os.path.join(directory_path, item)
-                
-                # Skip ignored directories
-                if os.path.isdir(full_path):
-                    dir_name = os.path.basename(full_path)
-                    if dir_name in self.ignore_directories or dir_name.startswith('.'):
-                        continue
-                    
-                    # Process subdirectory
-                    dir_lines = self._process_directory(full_path, base_dir)
-                    total_lines += dir_lines
-                    
-                    # Extract first level directory for tracking
-                    rel_path = os.path.relpath(full_path, base_dir)
-                    top_dir = rel_path.split(os.sep)[0]
-                    first_level_dirs[top_dir] = first_level_dirs.get(top_dir, 0) + dir_lines
-                
-                # Process files
-                elif os.path.isfile(full_path):
-                    _, ext = os.path.splitext(full_path)
-                    if ext in self.extensions:
-                        try:
-                            with open(full_path, 'r', encoding='utf-8') as f:
-                                lines = [line for line in f.read().splitlines() if line.strip()]
-                                lines_count = len(lines)
-                                total_lines += lines_count
-                                self.lines_by_extension[ext] += lines_count
-                                
-                                # Add to first level directory count
-                                rel_path = os.path.relpath(os.path.dirname(full_path), base_dir)
-                                if rel_path == '.':
-                                    # Files in the root directory
-                                    first_level_dirs['.'] = first_level_dirs.get('.', 0) + lines_count
-                                else:
-                                    top_dir = rel_path.split(os.sep)[0]
-                                    first_level_dirs[top_dir] = first_level_dirs.get(top_dir, 0) + lines_count
-                        except Exception:
-                            # Skip files that can't be read
-                            continue
-        
-        except Exception as e:
-            # Skip directories that can't be processed
-            print(f"Warning: Couldn't process {directory_path}: {str(e)}", file=sys.stderr)
-        
-        # Update directory counts (only at the base level)
-        if directory_path == base_dir:
-            for dir_name, count in first_level_dirs.items():
-                if dir_name != '.':
-                    self.lines_by_directory[dir_name] = count
-                    
-            # If there were files in the root directory
-            if '.' in first_level_dirs:
-                self.lines_by_directory['(root directory)'] = first_level_dirs['.']
+        # Paths are only split once per directory, not once per file
+        tree = self.directory_tree = DirectoryNode()
+        for dir_path, lines_count in lines_by_path.items():
+            tree.add(dir_path.split('/') if dir_path else (), lines_count)
+        
+        # First level directories are listed even when they hold no counted files
+        for dir_name in top_dirs:
+            self.lines_by_directory[dir_name] = tree.lines_under(dir_name)
+            
+        # If there were files in the root directory
+        if '' in lines_by_path:
+            self.lines_by_directory['(root directory)'] = lines_by_path['']
         
         return total_lines
+    
+    def update_files(self, paths):
+        """
+        Recount files below the directory counted last and update every total.
+        Needs keep_files. Paths that no longer exist or are not counted files
+        (wrong extension, inside an ignored directory) are dropped from the
+        totals.
+        
+        Args:
+            paths: Paths below self.root, in the same form the walk produces
+        
+        Returns:
+            Paths of the files whose counts changed
+        """
+        changed = []
+        items = []
+        for path in paths:
+            old = self.files.pop(path, None)
+            item = self._classify(path)
+            if item is not None and os.path.isfile(path):
+                items.append((item, old))
+            elif old is not None:
+                self._add_file(old, -1)
+                changed.append(path)
+        
+        if self.jobs > 1 and len(items) > self.batch_size:
+            results = self._count_parallel((item, CACHE_MISS) for item, _ in items)
+        else:
+            results = ((item, count_file(item[0], item[1], self.languages)) for item, _ in items)
+        old_counts = {item[0]: old for item, old in items}
+        
+        for (path, ext, dir_path), lines_count in results:
+            old = old_counts[path]
+            new = None if lines_count is None else (ext, dir_path, lines_count)
+            if new == old:
+                if old is not None:
+                    self.files[path] = old
+                continue
+            if old is not None:
+                self._add_file(old, -1)
+            if new is not None:
+                self.files[path] = new
+                self._add_file(new, 1)
+            changed.append(path)
+        
+        # First level directories come and go with the tree
+        root_lines = self.directory_tree.own_lines()
+        self.lines_by_directory = defaultdict(int, (
+            (name, self.directory_tree.lines_under(name))
+            for name in set(self.lines_by_directory) | set(self.directory_tree.children)
+            if name != '(root directory)' and os.path.isdir(os.path.join(self.root, name))))
+        if root_lines:
+            self.lines_by_directory['(root directory)'] = root_lines
+        return changed
+    
+    def files_under(self, path):
+        """Paths of the counted files below directory path."""
+        prefix = os.path.join(path, '')
+        return [file_path for file_path in self.files if file_path.startswith(prefix)]
+    
+    def _add_file(self, file, sign):
+        """Add (sign 1) or remove (sign -1) a (extension, directory, count) from the totals."""
+        ext, dir_path, lines_count = file
+        if self.languages is not None:
+            stats = self.stats_by_extension[ext]
+            for i, count in enumerate(lines_count):
+                stats[i] += sign * count
+            lines_count = lines_count.code + lines_count.comments
+        self.lines_by_extension[ext] += sign * lines_count
+        self.directory_tree.add(dir_path.split('/') if dir_path else (), sign * lines_count)
+    
+    def _classify(self, path):
+        """
+        Return the (path, extension, directory) item the walk would produce
+        for path, or None if it wouldn't be counted.
+        """
+        _, ext = os.path.splitext(path)
+        if ext not in self.extensions:
+            return None
+        relative = os.path.relpath(path, self.root)
+        dir_names = relative.split(os.sep)[:-1]
+        if any(d in self.ignore_directories or d.startswith('.') for d in dir_names):
+            return None
+        return path, ext, '/'.join(dir_names)
+    
+    def _walk_files(self, directory_path, top_dirs):
+        """
+        Yield (path, extension, directory) for every file with a matching
+        extension, where directory is the '/' separated path of the file's
+        directory relative to directory_path ('' for the root). First level
+        directories that are not ignored are appended to top_dirs as they are
+        discovered.
+        """
+        def skip_dir(entry):
+            return entry.name in self.ignore_directories or entry.name.startswith('.')
+        
+        def onerror(e):
+            # Skip directories that can't be processed
+            print(f"Warning: Couldn't process {e.filename}: {str(e)}", file=sys.stderr)
+        
+        prefix_length = len(os.path.join(directory_path, ''))
+        for top_dir, entry in fswalk.walk(directory_path, skip_dir, onerror):
+            if entry.is_dir(follow_symlinks=False):
+                if top_dir is None:
+                    top_dirs.append(entry.name)
+                continue
+            
+            name = entry.name
+            _, ext = os.path.splitext(name)
+            if ext in self.extensions and entry.is_file():
+                path = entry.path
+                dir_path = path[prefix_length:len(path) - len(name) - 1]
+                if os.sep != '/':
+                    dir_path = dir_path.replace(os.sep, '/')
+                yield path, ext, dir_path
+    
+    def _git_index_files(self, directory_path, top_dirs):
+        """
+        Like _walk_files, but takes the file list from the git index, so only
+        tracked files are counted and untracked trees are never traversed.
+        """
+        repository = find_git_repository(directory_path)
+        if repository is None:
+            raise ValueError(f"Directory '{directory_path}' is not inside a git repository")
+        work_tree, git_dir = repository
+        
+        # Only index entries below the scanned directory are counted
+        prefix = os.path.relpath(os.path.abspath(directory_path), work_tree)
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+        
+        seen_top_dirs = set()
+        for name in read_git_index(git_dir):
+            if not name.startswith(prefix):
+                continue
+            parts = name[len(prefix):].split('/')
+            dir_names = parts[:-1]
+            if any(d in self.ignore_directories or d.startswith('.') for d in dir_names):
+                continue
+            
+            if dir_names and dir_names[0] not in seen_top_dirs:
+                seen_top_dirs.add(dir_names[0])
+                top_dirs.append(dir_names[0])
+            
+            _, ext = os.path.splitext(parts[-1])
+            if ext in self.extensions:
+                yield os.path.join(directory_path, *parts), ext, '/'.join(dir_names)
+    
+    def _lookup_cached(self, files):
+        """Yield (item, lines) for files, lines being the cached count or CACHE_MISS."""
+        for item in files:
+            try:
+                stat_result = os.stat(item[0])
+            except OSError:
+                # Skip files that disappeared during the scan
+                continue
+            yield item, self.cache.lookup(item[0], stat_result, detailed=self.languages is not None)
+    
+    def _count_serial(self, files, cache=None):
+        """Yield (item, lines) for (item, lines) pairs, counting the CACHE_MISS ones and storing them in cache."""
+        for item, lines_count in files:
+            if lines_count is CACHE_MISS:
+                lines_count = count_file(item[0], item[1], self.languages)
+                if cache is not None:
+                    cache.store(item[0], lines_count)
+            yield item, lines_count
+    
+    def _count_parallel(self, files, cache=None):
+        """
+        Like _count_serial, counting in a process pool and yielding counted
+        files as batches complete. Discovery keeps feeding the pool while
+        workers count, with a bounded number of batches in flight.
+        """
+        max_pending = self.jobs * 4
+        pending = {}
+        
+        def drain(return_when):
+            done, _ = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                batch = pending.pop(future)
+                for item, lines_count in zip(batch, future.result()):
+                    if cache is not None:
+                        cache.store(item[0], lines_count)
+                    yield item, lines_count
+        
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                                    initargs=(self.languages,)) as executor:
+            batch = []
+            for item, lines_count in files:
+                if lines_count is not CACHE_MISS:
+                    yield item, lines_count
+                    continue
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    pending[executor.submit(_count_batch, [i[:2] for i in batch])] = batch
+                    batch = []
+                    if len(pending) >= max_pending:
+                        yield from drain(concurrent.futures.FIRST_COMPLETED)
+            if batch:
+                pending[executor.submit(_count_batch, [i[:2] for i in batch])] = batch
+            while pending:
+                yield from drain(concurrent.futures.ALL_COMPLETED)
+
+
+class Inotify:
+    """
+    Minimal inotify binding over ctypes (Linux only).
+    
+    Raises OSError when inotify isn't available.
+    """
+    MODIFY = 0x00000002
+    CLOSE_WRITE = 0x00000008
+    MOVED_FROM = 0x00000040
+    MOVED_TO = 0x00000080
+    CREATE = 0x00000100
+    DELETE = 0x00000200
+    Q_OVERFLOW = 0x00004000
+    IGNORED = 0x00008000
+    ONLYDIR = 0x01000000
+    ISDIR = 0x40000000
+    
+    _EVENT = struct.Struct('iIII')
+    
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available on this platform")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+    
+    def add_watch(self, path, mask):
+        """Watch a directory and return its watch descriptor."""
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+    
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+    
+    def read(self, timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) for events and return
+        them as (wd, mask, name) tuples, or [] on timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Keeps the totals of a LineCounter current after its first count by
+    recounting only the files inotify reports as changed.
+    
+    Events are collected until none arrived for debounce seconds (at most
+    ten times that), so a burst of writes such as a git checkout costs a
+    single update.
+    
+    Args:
+        counter: LineCounter created with keep_files that has counted a directory
+        debounce: Quiet period in seconds before changes are counted
+    """
+    EVENTS = (Inotify.MODIFY | Inotify.CLOSE_WRITE | Inotify.CREATE | Inotify.DELETE |
+              Inotify.MOVED_FROM | Inotify.MOVED_TO | Inotify.ONLYDIR)
+    
+    def __init__(self, counter, debounce=0.5):
+        self.counter = counter
+        self.debounce = debounce
+        self.inotify = Inotify()
+        # Watch descriptor -> directory path
+        self.watches = {}
+        self.overflowed = False
+        self._watch_tree(counter.root)
+    
+    def run(self, on_update):
+        """
+        Watch until interrupted, calling on_update(changed_paths) after every
+        burst of changes that changed a count.
+        """
+        while True:
+            dirty = set()
+            self._handle(self.inotify.read(), dirty)
+            deadline = time.monotonic() + self.debounce * 10
+            while True:
+                timeout = min(self.debounce, deadline - time.monotonic())
+                events = self.inotify.read(timeout) if timeout > 0 else []
+                if not events:
+                    break
+                self._handle(events, dirty)
+            
+            if self.overflowed:
+                # Events were lost, so every file is checked again
+                self.overflowed = False
+                dirty.update(self.counter.files)
+                dirty.update(self._watch_tree(self.counter.root))
+            
+            changed = self.counter.update_files(dirty)
+            if changed:
+                on_update(changed)
+    
+    def close(self):
+        self.inotify.close()
+    
+    def _skip_dir(self, name):
+        return name in self.counter.ignore_directories or name.startswith('.')
+    
+    def _watch(self, path):
+        try:
+            self.watches[self.inotify.add_watch(path, self.EVENTS)] = path
+        except OSError as e:
+            print(f"Warning: Couldn't watch {path}: {str(e)}", file=sys.stderr)
+    
+    def _watch_tree(self, path):
+        """Watch path and the directories below it; return the files found below it."""
+        self._watch(path)
+        files = []
+        for _, entry in fswalk.walk(path, lambda entry: self._skip_dir(entry.name)):
+            if entry.is_dir(follow_symlinks=False):
+                self._watch(entry.path)
+            else:
+                files.append(entry.path)
+        return files
+    
+    def _unwatch_tree(self, path):
+        """Stop watching path and the directories below it."""
+        prefix = os.path.join(path, '')
+        for wd, directory in list(self.watches.items()):
+            if directory == path or directory.startswith(prefix):
+                del self.watches[wd]
+                self.inotify.rm_watch(wd)
+    
+    def _handle(self, events, dirty):
+        """Add the files affected by events to dirty."""
+        for wd, mask, name in events:
+            if mask & Inotify.Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & Inotify.IGNORED:
+                # The directory itself is gone
+                del self.watches[wd]
+                continue
+            
+            path = os.path.join(directory, name)
+            if not mask & Inotify.ISDIR:
+                dirty.add(path)
+            elif self._skip_dir(name):
+                continue
+            elif mask & (Inotify.CREATE | Inotify.MOVED_TO):
+                # Files may have been created before the watch was added
+                dirty.update(self._watch_tree(path))
+            elif mask & (Inotify.DELETE | Inotify.MOVED_FROM):
+                # A directory moved away keeps its watches, and its files send no events
+                self._unwatch_tree(path)
+                dirty.update(self.counter.files_under(path))
+
+
+# File types counted and directory names skipped by the command line
+EXTENSIONS = [
+    ".ts",
+    ".tsx",
+    ".js",
+    ".jsx",
+    ".html",
+    ".css",
+    ".cs",
+    ".c",
+    ".cpp",
+    ".h",
+    ".py",
+]
+
+IGNORE_DIRECTORIES = [
+    "bin",
+    "obj",
+    "node_modules",
+    "dist",
+    "build",
+    ".git",
+    ".vs",
+    ".vscode",
+    "Migrations",
+]
+
+
+def file_record(path, ext, lines_count):
+    """Per-file NDJSON record for a count returned by count_file."""
+    record = {"type": "file", "path": path, "extension": ext}
+    if isinstance(lines_count, FileStats):
+        record["lines"] = lines_count.code + lines_count.comments
+        record.update(lines_count._asdict())
+    else:
+        record["lines"] = lines_count
+    return record
+
+
+def directory_rows(lines_by_directory, directory_tree, depth=1):
+    """
+    List (path, lines, level) for the first level directories, each followed
+    by its subdirectories up to depth levels from directory_tree. Siblings
+    are sorted by line count (descending), ties by name.
+    """
+    rows = []
+    for directory, count in sorted(lines_by_directory.items(), key=lambda x: (-x[1], x[0])):
+        rows.append((directory, count, 1))
+        node = directory_tree.children.get(directory) if depth > 1 else None
+        if node is not None:
+            rows.extend((f"{directory}/{path}", lines, level + 1) for path, lines, level in node.walk(depth - 1))
+    return rows
 
 
-def main():
+def summary_record(total_lines, lines_by_extension, rows, stats_by_extension=None):
+    """
+    Aggregates of a scan as a JSON serializable dict, with the directory
+    rows from directory_rows keyed by path. Extensions are sorted by line
+    count (descending), as in the text output.
+    """
+    record = {
+        "type": "summary",
+        "total_lines": total_lines,
+        "by_extension": dict(sorted(lines_by_extension.items(), key=lambda x: x[1], reverse=True)),
+        "by_directory": {path: lines for path, lines, _ in rows},
+    }
+    if stats_by_extension is not None:
+        record["stats_by_extension"] = {ext: dict(zip(FileStats._fields, stats_by_extension[ext]))
+                                        for ext in record["by_extension"]}
+    return record
+
+
+def write_csv(summary, out):
+    """Write a summary record as CSV rows of (type, name, lines, code, comments, blanks)."""
+    writer = csv.writer(out)
+    writer.writerow(["type", "name", "lines", "code", "comments", "blanks"])
+    writer.writerow(["total", "", summary["total_lines"], "", "", ""])
+    stats_by_extension = summary.get("stats_by_extension", {})
+    for ext, count in summary["by_extension"].items():
+        stats = stats_by_extension.get(ext)
+        writer.writerow(["extension", ext, count] + (list(stats.values()) if stats else ["", "", ""]))
+    for directory, count in summary["by_directory"].items():
+        writer.writerow(["directory", directory, count, "", "", ""])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Count non-blank lines of code by file type and directory.")
+    parser.add_argument("directory", nargs="?", default=os.getcwd(),
+                        help="directory to scan (default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes used to count files (0 = one per CPU)")
+    parser.add_argument("--git", action="store_true",
+                        help="only count files tracked in the git index instead of walking the directory")
+    parser.add_argument("--detailed", action="store_true",
+                        help="split lines into code, comment and blank lines per language")
+    parser.add_argument("--format", choices=["text", "json", "csv", "ndjson"], default="text",
+                        help="output format; ndjson streams one record per file followed by a summary record")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="count every file without reading or updating the line count cache")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="discard cached counts for this directory and count every file again")
+    parser.add_argument("--cache-file", default=None,
+                        help=f"line count cache location (default: {default_cache_path()})")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="directory levels to break line counts down to (default: 1)")
+    parser.add_argument("--watch", action="store_true",
+                        help="after counting, keep the totals current by recounting files as they change (Linux)")
+    parser.add_argument("--debounce", type=float, default=0.5,
+                        help="seconds without changes before --watch recounts (default: 0.5)")
+    parser.add_argument("--test", action="store_true", help="run the built-in tests")
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("--depth must be at least 1")
+    if args.watch and args.git:
+        parser.error("--watch can't be combined with --git")
+    if args.watch and args.format == "csv":
+        parser.error("--watch needs --format text, json or ndjson")
+    return args
+
+
+def main(args):
     # Get target directory
-    target_dir = os.getcwd()
-    if len(sys.argv) > 1:
-        target_dir = sys.argv[1]
+    target_dir = args.directory
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    
+    on_file = None
+    if args.format == "ndjson":
+        # Records are written as files are counted, nothing is buffered
+        def on_file(path, ext, lines_count):
+            record = file_record(os.path.relpath(path, target_dir), ext, lines_count)
+            sys.stdout.write(json.dumps(record) + "\n")
     
     try:
-        extensions = [
-            ".ts",
-            ".tsx",
-            ".js",
-            ".jsx",
-            ".html",
-            ".css",
-            ".cs",
-            ".c",
-            ".cpp",
-            ".h",
-            ".py",
-        ]
-        
-        ignore_directories = [
-            "bin",
-            "obj",
-            "node_modules",
-            "dist",
-            "build",
-            ".git",
-            ".vs",
-            ".vscode",
-            "Migrations"
-        ]
+        cache = None
+        if not args.no_cache:
+            try:
+                cache = LineCountCache(args.cache_file or default_cache_path(), target_dir, rebuild=args.rebuild_cache)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Warning: Line count cache disabled: {str(e)}", file=sys.stderr)
         
-        counter = LineCounter(extensions, ignore_directories)
-        total_lines, lines_by_extension, lines_by_directory = counter.count_lines_in_directory(target_dir)
+        try:
+            counter = LineCounter(EXTENSIONS, IGNORE_DIRECTORIES, jobs=jobs, cache=cache, git_index=args.git,
+                                  languages=LANGUAGES if args.detailed else None, on_file=on_file,
+                                  keep_files=args.watch)
+            total_lines, lines_by_extension, lines_by_directory = counter.count_lines_in_directory(target_dir)
+            if cache is not None:
+                try:
+                    cache.save()
+                except sqlite3.Error as e:
+                    print(f"Warning: Couldn't update line count cache: {str(e)}", file=sys.stderr)
+        finally:
+            if cache is not None:
+                cache.close()
         
-        print(f"Total lines of code: {total_lines}")
-        print("\nBreakdown by file type:")
+        rows = directory_rows(lines_by_directory, counter.directory_tree, args.depth)
+        if args.format != "text":
+            summary = summary_record(total_lines, lines_by_extension, rows,
+                                     counter.stats_by_extension if args.detailed else None)
+            if args.format == "csv":
+                write_csv(summary, sys.stdout)
+            elif args.format == "json":
+                json.dump(summary, sys.stdout, indent=2)
+                sys.stdout.write("\n")
+            else:
+                sys.stdout.write(json.dumps(summary) + "\n")
+        else:
+            print_report(args, counter, total_lines, rows)
         
-        # Sort extensions by line count (descending)
-        for ext, count in sorted(lines_by_extension.items(), key=lambda x: x[1], reverse=True):
+        if args.watch:
+            watch(args, counter, target_dir)
+    
+    except Exception as ex:
+        # Keep machine readable output parseable
+        print(f"Error: {str(ex)}", file=sys.stdout if args.format == "text" else sys.stderr)
+
+
+def print_report(args, counter, total_lines, rows):
+    """Print the human readable totals of a count."""
+    lines_by_extension = counter.lines_by_extension
+    lines_by_directory = counter.lines_by_directory
+    
+    print(f"Total lines of code: {total_lines}")
+    print("\nBreakdown by file type:")
+    
+    # Sort extensions by line count (descending)
+    for ext, count in sorted(lines_by_extension.items(), key=lambda x: x[1], reverse=True):
+        if args.detailed:
+            code, comments, blanks = counter.stats_by_extension[ext]
+            print(f"  {ext}: {count} lines ({code} code, {comments} comments, {blanks} blank)")
+        else:
             print(f"  {ext}: {count} lines")
+    
+    print("\nBy directory:")
+    # Sorted by line count (descending), subdirectories below their parent
+    for directory, count, level in rows:
+        print(f"  {'   ' * (level - 1)}-- {directory}: {count} lines")
         
-        print("\nBy directory:")
-        # Sort directories by line count (descending)
-        for directory, count in sorted(lines_by_directory.items(), key=lambda x: x[1], reverse=True):
-            print(f"  -- {directory}: {count} lines")
-            
-        # Verify the totals match
-        dir_total = sum(lines_by_directory.values())
-        ext_total = sum(lines_by_extension.values())
-        if total_lines != dir_total or total_lines != ext_total:
-            print("\nWarning: Inconsistency in line counts detected:")
-            print(f"  Total lines: {total_lines}")
-            print(f"  Sum of directory counts: {dir_total}")
-            print(f"  Sum of extension counts: {ext_total}")
+    # Verify the totals match
+    dir_total = sum(lines_by_directory.values())
+    ext_total = sum(lines_by_extension.values())
+    if total_lines != dir_total or total_lines != ext_total:
+        print("\nWarning: Inconsistency in line counts detected:")
+        print(f"  Total lines: {total_lines}")
+        print(f"  Sum of directory counts: {dir_total}")
+        print(f"  Sum of extension counts: {ext_total}")
+
+
+def watch(args, counter, target_dir):
+    """
+    Keep the counts of target_dir current with a DirectoryWatcher and write
+    the new totals after every change, until interrupted.
+    """
+    watcher = DirectoryWatcher(counter, args.debounce)
+    if args.format == "text":
+        print(f"\nWatching {target_dir} for changes (Ctrl+C to stop)...")
+    sys.stdout.flush()
+    previous_total = counter.directory_tree.lines
     
-    except Exception as ex:
-        print(f"Error: {str(ex)}")
+    def on_update(changed):
+        nonlocal previous_total
+        total_lines = counter.directory_tree.lines
+        if args.format == "text":
+            print(f"[{time.strftime('%H:%M:%S')}] Total lines of code: {total_lines} "
+                  f"({total_lines - previous_total:+d}), {len(changed)} files changed")
+        else:
+            if args.format == "ndjson":
+                for path in changed:
+                    relative_path = os.path.relpath(path, target_dir)
+                    file = counter.files.get(path)
+                    if file is None:
+                        record = {"type": "file", "path": relative_path, "deleted": True}
+                    else:
+                        record = file_record(relative_path, file[0], file[2])
+                    sys.stdout.write(json.dumps(record) + "\n")
+            rows = directory_rows(counter.lines_by_directory, counter.directory_tree, args.depth)
+            summary = summary_record(total_lines, counter.lines_by_extension, rows,
+                                     counter.stats_by_extension if args.detailed else None)
+            sys.stdout.write(json.dumps(summary) + "\n")
+        sys.stdout.flush()
+        previous_total = total_lines
+    
+    try:
+        watcher.run(on_update)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def run_tests():
@@ -385,6 +1526,621 @@ def run_tests():
             shutil.rmtree(test_dir)
             print(f"\nCleaned up test directory: {test_dir}")
     
+    # Test 4: Parallel counting matches the serial path
+    print("\n\nTEST 4: Parallel counting matches serial counting")
+    print("------------------------------------------------")
+    
+    test_dir = "loc_test_parallel"
+    if os.path.exists(test_dir):
+        import shutil
+        shutil.rmtree(test_dir)
+    
+    try:
+        # Create a tree with more files than a single batch
+        for i in range(40):
+            sub_dir = os.path.join(test_dir, f"dir{i % 4}", f"sub{i % 3}")
+            os.makedirs(sub_dir, exist_ok=True)
+            ext = ".py" if i % 2 else ".js"
+            with open(os.path.join(sub_dir, f"file{i}{ext}"), "w") as f:
+                f.write("line\n\n" * (i + 1))
+        with open(os.path.join(test_dir, "root.py"), "w") as f:
+            f.write("line1\nline2\n")
+        os.makedirs(os.path.join(test_dir, "empty"))
+        print(f"Created 41 files under {test_dir}")
+        
+        serial = LineCounter(extensions=[".py", ".js"], ignore_directories=[])
+        expected = serial.count_lines_in_directory(test_dir)
+        
+        print("\nCounting lines with 2 worker processes and a batch size of 8...")
+        parallel = LineCounter(extensions=[".py", ".js"], ignore_directories=[], jobs=2, batch_size=8)
+        total_lines, lines_by_extension, lines_by_directory = parallel.count_lines_in_directory(test_dir)
+        
+        test4_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - Total lines: Expected {expected[0]}, Got {total_lines}")
+        if total_lines != expected[0]:
+            print(f"    ERROR: Total line count mismatch")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Total count correct")
+        
+        print(f"  - Lines by extension: Expected {dict(expected[1])}, Got {dict(lines_by_extension)}")
+        if dict(lines_by_extension) != dict(expected[1]):
+            print(f"    ERROR: Extension counts mismatch")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Extension counts correct")
+        
+        print(f"  - Lines by directory: Expected {dict(expected[2])}, Got {dict(lines_by_directory)}")
+        if dict(lines_by_directory) != dict(expected[2]):
+            print(f"    ERROR: Directory counts mismatch")
+            test4_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Directory counts correct")
+        
+        if test4_passed:
+            print("\nTEST 4: PASSED")
+        else:
+            print("\nTEST 4: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            import shutil
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 5: Cached counts are reused, refreshed and evicted
+    print("\n\nTEST 5: Line count cache")
+    print("-----------------------")
+    
+    test_dir = "loc_test_cache"
+    cache_file = "loc_test_cache.sqlite"
+    for path in (test_dir, cache_file):
+        if os.path.isdir(path):
+            import shutil
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    
+    try:
+        os.makedirs(os.path.join(test_dir, "src"))
+        kept_file = os.path.join(test_dir, "src", "kept.py")
+        changed_file = os.path.join(test_dir, "src", "changed.py")
+        deleted_file = os.path.join(test_dir, "deleted.py")
+        for file_path, content in ((kept_file, "a\nb\n"), (changed_file, "a\n"), (deleted_file, "a\nb\nc\n")):
+            with open(file_path, "w") as f:
+                f.write(content)
+        print(f"Created 3 files under {test_dir}")
+        
+        print("\nCounting with an empty cache...")
+        with LineCountCache(cache_file, test_dir) as cache:
+            LineCounter(extensions=[".py"], ignore_directories=[], cache=cache).count_lines_in_directory(test_dir)
+            cache.save()
+        
+        print("Changing one file, deleting another and counting again...")
+        with open(changed_file, "w") as f:
+            f.write("a\nb\nc\nd\n")
+        os.remove(deleted_file)
+        with LineCountCache(cache_file, test_dir) as cache:
+            cached_entries = len(cache.entries)
+            counter = LineCounter(extensions=[".py"], ignore_directories=[], cache=cache)
+            total_lines, lines_by_extension, lines_by_directory = counter.count_lines_in_directory(test_dir)
+            recounted = [os.path.basename(os.fsdecode(update[0])) for update in cache.updates]
+            cache.save()
+        with LineCountCache(cache_file, test_dir) as cache:
+            remaining_entries = sorted(os.path.basename(path) for path in cache.entries)
+        
+        test5_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - Total lines: Expected 6, Got {total_lines}")
+        if total_lines != 6:
+            print(f"    ERROR: Total line count mismatch")
+            test5_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Total count correct")
+        
+        print(f"  - Entries loaded from cache: Expected 3, Got {cached_entries}")
+        print(f"  - Recounted files: Expected ['changed.py'], Got {recounted}")
+        if cached_entries != 3 or recounted != ["changed.py"]:
+            print(f"    ERROR: Unchanged files should be served from the cache")
+            test5_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Only the changed file was recounted")
+        
+        print(f"  - Cache entries after eviction: Expected ['changed.py', 'kept.py'], Got {remaining_entries}")
+        if remaining_entries != ["changed.py", "kept.py"]:
+            print(f"    ERROR: Deleted files should be evicted from the cache")
+            test5_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Deleted file evicted")
+        
+        if test5_passed:
+            print("\nTEST 5: PASSED")
+        else:
+            print("\nTEST 5: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            import shutil
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+    
+    # Test 6: Streaming counter keeps str.splitlines()/str.strip() semantics
+    print("\n\nTEST 6: Streaming line counter edge cases")
+    print("-----------------------------------------")
+    
+    test_file = "loc_test_stream.py"
+    cases = [
+        ("CRLF and CR line endings", "a\r\nb\rc\r\n\r\n".encode(), 3),
+        ("whitespace-only lines", " \t\n\x1f\n\u00a0\u3000\nx\n".encode(), 1),
+        ("unicode line separators", "a\u2028b\x85c\x0cd".encode(), 4),
+        ("non-breaking text", "caf\u00e9\n\u65e5\u672c\n\ufeff\n".encode(), 3),
+        ("invalid UTF-8 is skipped", b"a\n\xff\n", None),
+        ("truncated UTF-8 is skipped", b"a\n\xe2\x80", None),
+    ]
+    original_chunk_size = CHUNK_SIZE
+    test6_passed = True
+    
+    try:
+        print("\nChecking results with 3 byte chunks:")
+        globals()["CHUNK_SIZE"] = 3
+        for description, content, expected in cases:
+            with open(test_file, "wb") as f:
+                f.write(content)
+            lines_count = count_file_lines(test_file)
+            print(f"  - {description}: Expected {expected}, Got {lines_count}")
+            if lines_count != expected:
+                print(f"    ERROR: Line count mismatch")
+                test6_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ Count correct")
+        
+        if test6_passed:
+            print("\nTEST 6: PASSED")
+        else:
+            print("\nTEST 6: FAILED")
+    
+    finally:
+        # Cleanup
+        globals()["CHUNK_SIZE"] = original_chunk_size
+        if os.path.exists(test_file):
+            os.remove(test_file)
+            print(f"\nCleaned up test file: {test_file}")
+    
+    # Test 7: Git index enumeration
+    print("\n\nTEST 7: Counting only files tracked in the git index")
+    print("----------------------------------------------------")
+    
+    import shutil
+    import subprocess
+    test_dir = "loc_test_git"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    if shutil.which("git") is None:
+        print("git is not installed, skipping")
+        print("\nTEST 7: SKIPPED")
+    else:
+        try:
+            os.makedirs(os.path.join(test_dir, "src"))
+            os.makedirs(os.path.join(test_dir, "out"))
+            test_files = [
+                (os.path.join(test_dir, "src", "main.py"), "line1\nline2\nline3\n", "tracked"),
+                (os.path.join(test_dir, "setup.py"), "line1\n", "tracked"),
+                (os.path.join(test_dir, "out", "generated.py"), "line1\nline2\n", "untracked"),
+            ]
+            for file_path, content, state in test_files:
+                with open(file_path, "w") as f:
+                    f.write(content)
+                print(f"  - Created {file_path} ({state})")
+            
+            subprocess.run(["git", "init", "-q"], cwd=test_dir, check=True)
+            subprocess.run(["git", "add", "setup.py", "src"], cwd=test_dir, check=True)
+            
+            test7_passed = True
+            expected_by_dir = {"src": 3, "(root directory)": 1}
+            
+            print("\nChecking results:")
+            for index_version in ("2", "4"):
+                subprocess.run(["git", "update-index", "--index-version", index_version], cwd=test_dir, check=True)
+                counter = LineCounter(extensions=[".py"], ignore_directories=[], git_index=True)
+                total_lines, _, lines_by_directory = counter.count_lines_in_directory(test_dir)
+                
+                print(f"  - Index v{index_version} total lines: Expected 4, Got {total_lines}")
+                print(f"  - Index v{index_version} lines by directory: Expected {expected_by_dir}, Got {dict(lines_by_directory)}")
+                if total_lines != 4 or dict(lines_by_directory) != expected_by_dir:
+                    print(f"    ERROR: Only tracked files should be counted")
+                    test7_passed = False
+                    all_tests_passed = False
+                else:
+                    print(f"    ✓ Untracked files ignored")
+            
+            if test7_passed:
+                print("\nTEST 7: PASSED")
+            else:
+                print("\nTEST 7: FAILED")
+        
+        finally:
+            # Cleanup
+            if os.path.exists(test_dir):
+                shutil.rmtree(test_dir)
+                print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 8: Code, comment and blank lines
+    print("\n\nTEST 8: Code, comment and blank lines")
+    print("------------------------------------")
+    
+    import shutil
+    test_dir = "loc_test_detailed"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    try:
+        os.makedirs(test_dir)
+        samples = [
+            ("sample.py",
+             '"""Module docstring\n'
+             'spanning lines."""\n'
+             'import os  # trailing comment\n'
+             '\n'
+             '# full line comment\n'
+             'x = "# not a comment"\n'
+             'def f():\n'
+             "    r\'\'\'raw docstring\'\'\'\n"
+             "    return \'\'\'\n"
+             '# inside a string\n'
+             "\'\'\'\n",
+             [6, 4, 1]),
+            ("sample.js",
+             '/* header\n'
+             '   comment */\n'
+             'const a = "// not a comment"; // trailing\n'
+             'const t = `\n'
+             '/* inside a template */\n'
+             '`;\n'
+             '\n'
+             '// done\n',
+             [4, 3, 1]),
+        ]
+        for file_name, content, _ in samples:
+            with open(os.path.join(test_dir, file_name), "w") as f:
+                f.write(content)
+            print(f"  - Created {file_name}")
+        
+        counter = LineCounter(extensions=[".py", ".js"], ignore_directories=[], languages=LANGUAGES)
+        total_lines, lines_by_extension, _ = counter.count_lines_in_directory(test_dir)
+        
+        test8_passed = True
+        
+        print("\nChecking results:")
+        for file_name, _, expected in samples:
+            ext = os.path.splitext(file_name)[1]
+            got = counter.stats_by_extension[ext]
+            print(f"  - {ext} [code, comments, blanks]: Expected {expected}, Got {got}")
+            if got != expected:
+                print(f"    ERROR: Comments and strings were not told apart")
+                test8_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ Breakdown correct")
+        
+        print(f"  - Total lines: Expected 17, Got {total_lines}")
+        if total_lines != 17:
+            print(f"    ERROR: Total should still count every non-blank line")
+            test8_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Total count correct")
+        
+        # Line breaks split like str.splitlines(): CR LF is one, CR before a
+        # Unicode break is two
+        for text in ("a\r\nb\r\n", "a\r\u2028\u2028b", "a\r\x85b\r", "a\u2029\r\n\r\n"):
+            with open(os.path.join(test_dir, "breaks.txt"), "wb") as f:
+                f.write(text.encode())
+            stats = count_file_stats(os.path.join(test_dir, "breaks.txt"))
+            expected_lines = len(text.splitlines())
+            print(f"  - Lines of {text!r}: Expected {expected_lines}, Got {sum(stats)}")
+            if sum(stats) != expected_lines:
+                print(f"    ERROR: Line breaks miscounted")
+                test8_passed = False
+                all_tests_passed = False
+            else:
+                print(f"    ✓ Line count correct")
+        
+        if test8_passed:
+            print("\nTEST 8: PASSED")
+        else:
+            print("\nTEST 8: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 9: Machine readable output
+    print("\n\nTEST 9: Per-file records and summary record")
+    print("-------------------------------------------")
+    
+    test_dir = "loc_test_format"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    try:
+        os.makedirs(os.path.join(test_dir, "src"))
+        for file_path, content in ((os.path.join(test_dir, "main.py"), "a\n\nb\n"),
+                                   (os.path.join(test_dir, "src", "app.js"), "a\n// b\n")):
+            with open(file_path, "w") as f:
+                f.write(content)
+        print(f"Created 2 files under {test_dir}")
+        
+        records = []
+        counter = LineCounter(extensions=[".py", ".js"], ignore_directories=[], languages=LANGUAGES,
+                              on_file=lambda path, ext, lines_count: records.append(
+                                  file_record(os.path.relpath(path, test_dir), ext, lines_count)))
+        total_lines, lines_by_extension, lines_by_directory = counter.count_lines_in_directory(test_dir)
+        rows = directory_rows(lines_by_directory, counter.directory_tree)
+        summary = json.loads(json.dumps(summary_record(total_lines, lines_by_extension, rows,
+                                                       counter.stats_by_extension)))
+        
+        expected_records = [
+            {"type": "file", "path": "main.py", "extension": ".py", "lines": 2, "code": 2, "comments": 0, "blanks": 1},
+            {"type": "file", "path": os.path.join("src", "app.js"), "extension": ".js", "lines": 2, "code": 1, "comments": 1, "blanks": 0},
+        ]
+        expected_summary = {
+            "type": "summary",
+            "total_lines": 4,
+            "by_extension": {".py": 2, ".js": 2},
+            "by_directory": {"src": 2, "(root directory)": 2},
+            "stats_by_extension": {".py": {"code": 2, "comments": 0, "blanks": 1},
+                                   ".js": {"code": 1, "comments": 1, "blanks": 0}},
+        }
+        
+        test9_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - File records: Expected {expected_records}, Got {records}")
+        if records != expected_records:
+            print(f"    ERROR: Every counted file should produce one record")
+            test9_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ File records correct")
+        
+        print(f"  - Summary record: Expected {expected_summary}, Got {summary}")
+        if summary != expected_summary:
+            print(f"    ERROR: Summary should hold the aggregates")
+            test9_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Summary record correct")
+        
+        if test9_passed:
+            print("\nTEST 9: PASSED")
+        else:
+            print("\nTEST 9: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 10: Directory tree
+    print("\n\nTEST 10: Line totals at any directory depth")
+    print("-------------------------------------------")
+    
+    test_dir = "loc_test_tree"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    try:
+        test_files = [
+            (os.path.join(test_dir, "root.py"), "a\n"),
+            (os.path.join(test_dir, "src", "main.py"), "a\nb\n"),
+            (os.path.join(test_dir, "src", "api", "routes.py"), "a\nb\nc\n"),
+            (os.path.join(test_dir, "src", "api", "v1", "users.py"), "a\nb\nc\nd\n"),
+            (os.path.join(test_dir, "src", "web", "app.js"), "a\nb\nc\n"),
+            (os.path.join(test_dir, "docs", "conf.py"), "a\n"),
+        ]
+        for file_path, content in test_files:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                f.write(content)
+            print(f"  - Created {file_path}")
+        
+        counter = LineCounter(extensions=[".py", ".js"], ignore_directories=[])
+        _, _, lines_by_directory = counter.count_lines_in_directory(test_dir)
+        tree = counter.directory_tree
+        rows = directory_rows(lines_by_directory, tree, depth=3)
+        
+        expected_under = {"src": 12, "src/api": 7, "src/api/v1": 4, "src/web": 3, "docs": 1, "missing": 0, "": 14}
+        got_under = {path: tree.lines_under(path) for path in expected_under}
+        expected_rows = [
+            ("src", 12, 1),
+            ("src/api", 7, 2),
+            ("src/api/v1", 4, 3),
+            ("src/web", 3, 2),
+            ("(root directory)", 1, 1),
+            ("docs", 1, 1),
+        ]
+        
+        test10_passed = True
+        
+        print("\nChecking results:")
+        print(f"  - Lines under path: Expected {expected_under}, Got {got_under}")
+        if got_under != expected_under:
+            print(f"    ERROR: Subdirectory totals mismatch")
+            test10_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Subdirectory totals correct")
+        
+        print(f"  - Rows to depth 3: Expected {expected_rows}, Got {rows}")
+        if rows != expected_rows:
+            print(f"    ERROR: Rows should be nested and sorted by lines, then name")
+            test10_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Rows correct")
+        
+        if test10_passed:
+            print("\nTEST 10: PASSED")
+        else:
+            print("\nTEST 10: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 11: Incremental updates used by --watch
+    print("\n\nTEST 11: Recounting changed files matches a full count")
+    print("------------------------------------------------------")
+    
+    test_dir = "loc_test_watch"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    try:
+        os.makedirs(os.path.join(test_dir, "src", "api"))
+        os.makedirs(os.path.join(test_dir, "node_modules"))
+        changed_file = os.path.join(test_dir, "src", "main.py")
+        deleted_file = os.path.join(test_dir, "root.js")
+        added_file = os.path.join(test_dir, "src", "api", "new.py")
+        ignored_file = os.path.join(test_dir, "node_modules", "lib.js")
+        for file_path, content in ((changed_file, "a\nb\n"), (deleted_file, "a\n"),
+                                   (os.path.join(test_dir, "src", "api", "kept.py"), "a\nb\nc\n")):
+            with open(file_path, "w") as f:
+                f.write(content)
+        print(f"Created 3 files under {test_dir}")
+        
+        counter = LineCounter(extensions=[".py", ".js"], ignore_directories=["node_modules"],
+                              languages=LANGUAGES, keep_files=True)
+        counter.count_lines_in_directory(test_dir)
+        
+        print("Changing, deleting and adding files...")
+        with open(changed_file, "w") as f:
+            f.write("a\n# b\n\nc\n")
+        os.remove(deleted_file)
+        for file_path in (added_file, ignored_file):
+            with open(file_path, "w") as f:
+                f.write("a\n")
+        changed = counter.update_files([changed_file, deleted_file, added_file, ignored_file])
+        
+        full = LineCounter(extensions=[".py", ".js"], ignore_directories=["node_modules"], languages=LANGUAGES)
+        full.count_lines_in_directory(test_dir)
+        
+        def totals(c):
+            return (c.directory_tree.lines,
+                    {ext: lines for ext, lines in c.lines_by_extension.items() if lines},
+                    dict(c.lines_by_directory),
+                    directory_rows(c.lines_by_directory, c.directory_tree, depth=2),
+                    {ext: stats for ext, stats in c.stats_by_extension.items() if any(stats)})
+        
+        test11_passed = True
+        
+        print("\nChecking results:")
+        expected_changed = sorted([changed_file, deleted_file, added_file])
+        print(f"  - Changed files: Expected {expected_changed}, Got {sorted(changed)}")
+        if sorted(changed) != expected_changed:
+            print(f"    ERROR: Ignored files shouldn't be counted")
+            test11_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Changed files correct")
+        
+        print(f"  - Updated totals: Expected {totals(full)}, Got {totals(counter)}")
+        if totals(counter) != totals(full):
+            print(f"    ERROR: Updated totals differ from a full count")
+            test11_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Updated totals match a full count")
+        
+        if test11_passed:
+            print("\nTEST 11: PASSED")
+        else:
+            print("\nTEST 11: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
+    # Test 12: The directory walker
+    print("\n\nTEST 12: fswalk.walk skips directories, reports errors and doesn't follow symlinks")
+    print("---------------------------------------------------------------------------------")
+    
+    test_dir = "loc_test_walk"
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    
+    try:
+        for directory in ("a/sub", "skipped", "gone"):
+            os.makedirs(os.path.join(test_dir, directory))
+        for file_path in ("file", "a/file", "a/sub/file", "skipped/file"):
+            with open(os.path.join(test_dir, file_path), "w") as f:
+                f.write("a\n")
+        os.symlink("a", os.path.join(test_dir, "link"))
+        print(f"Created files in a, a/sub and skipped, an empty directory and a symlink to a under {test_dir}")
+        
+        errors = []
+        walked = set()
+        for top, entry in fswalk.walk(test_dir, lambda entry: entry.name == "skipped", errors.append):
+            walked.add((top, os.path.relpath(entry.path, test_dir).replace(os.sep, "/")))
+            if entry.name == "gone":
+                # Removed between being listed and listed itself
+                os.rmdir(entry.path)
+        
+        test12_passed = True
+        
+        print("\nChecking results:")
+        expected_walked = {(None, "file"), (None, "a"), (None, "gone"), (None, "link"),
+                           ("a", "a/file"), ("a", "a/sub"), ("a", "a/sub/file")}
+        print(f"  - Entries: Expected {sorted(expected_walked, key=str)}, Got {sorted(walked, key=str)}")
+        if walked != expected_walked:
+            print(f"    ERROR: Skipped directories and symlinked ones shouldn't be descended into")
+            test12_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Entries correct")
+        
+        got_errors = [type(e).__name__ for e in errors]
+        print(f"  - Errors: Expected ['FileNotFoundError'], Got {got_errors}")
+        if got_errors != ["FileNotFoundError"]:
+            print(f"    ERROR: The directory that couldn't be listed should be reported")
+            test12_passed = False
+            all_tests_passed = False
+        else:
+            print(f"    ✓ Error reported")
+        
+        if test12_passed:
+            print("\nTEST 12: PASSED")
+        else:
+            print("\nTEST 12: FAILED")
+    
+    finally:
+        # Cleanup
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+            print(f"\nCleaned up test directory: {test_dir}")
+    
     # Summary
     print("\n======================")
     if all_tests_passed:
@@ -397,7 +2153,9 @@ def run_tests():
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+    args = parse_args()
+    if args.test:
         run_tests()
     else:
-        main() 
\ No newline at end of file
+        main(args)
+ 
\ No newline at end of file
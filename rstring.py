@@ -1,38 +1,696 @@
 import sys, getopt
+import base64
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
 import random
+import secrets
+import shutil
 import string
+import threading
+import time
 import uuid
  
 def random_string_generator(str_size, allowed_chars):
-    return ''.join(random.choice(allowed_chars) for x in range(str_size))
+    return ''.join(secrets.choice(allowed_chars) for x in range(str_size))
  
 chars = string.ascii_letters + "1234567890@#$%&"
 
 size = 12
 
+# Random bytes drawn from os.urandom per batch
+BATCH_BYTES = 1 << 20
+
+def _random_blocks(str_size, allowed_chars, count, randbytes=os.urandom):
+    """
+    Yield blocks of random characters for count strings of str_size, as
+    bytes holding one byte per character: the character itself for ASCII
+    alphabets, its index in allowed_chars otherwise.
+
+    Randomness comes from os.urandom, or randbytes, in large batches. Bytes
+    are mapped to characters with rejection sampling: bytes at or above the
+    largest multiple of len(allowed_chars) are dropped, so every character
+    is equally likely (no modulo bias). Both steps are bytes.translate
+    calls, so the work per character is done in C.
+    """
+    alphabet_size = len(allowed_chars)
+    if not 0 < alphabet_size <= 256:
+        raise ValueError("the alphabet must have between 1 and 256 characters")
+    limit = 256 - 256 % alphabet_size
+    rejected = bytes(range(limit, 256))
+    if allowed_chars.isascii():
+        table = bytes(ord(allowed_chars[i % alphabet_size]) for i in range(256))
+    else:
+        table = bytes(i % alphabet_size for i in range(256))
+
+    per_block = max(1, BATCH_BYTES // max(str_size, 1))
+    pending = b""
+    while count > 0:
+        strings = min(count, per_block)
+        needed = strings * str_size
+        data = pending
+        while len(data) < needed:
+            # A few more bytes than needed on average, to rarely go twice
+            data += randbytes((needed - len(data)) * 256 // limit + 64).translate(None, rejected)
+        pending = data[needed:]
+        yield strings, data[:needed].translate(table)
+        count -= strings
+
+def random_string_batches(str_size, allowed_chars, count):
+    """Yield lists of random strings, count of them in total, see _random_blocks."""
+    char_map = None if allowed_chars.isascii() else dict(enumerate(allowed_chars))
+    for strings, block in _random_blocks(str_size, allowed_chars, count):
+        text = block.decode("latin-1")
+        if char_map is not None:
+            text = text.translate(char_map)
+        if not str_size:
+            yield [""] * strings
+        else:
+            yield [text[i:i + str_size] for i in range(0, len(text), str_size)]
+
+def random_strings(str_size, allowed_chars, count):
+    """Iterate over count cryptographically secure random strings of str_size characters."""
+    return itertools.chain.from_iterable(random_string_batches(str_size, allowed_chars, count))
+
+def write_random_strings(out, str_size, allowed_chars, count):
+    """Write count random strings to the binary stream out, one per line, a batch per write."""
+    if allowed_chars.isascii() and str_size:
+        # Written as generated, without decoding
+        for strings, block in _random_blocks(str_size, allowed_chars, count):
+            out.write(b"\n".join([block[i:i + str_size] for i in range(0, len(block), str_size)]) + b"\n")
+    else:
+        for batch in random_string_batches(str_size, allowed_chars, count):
+            out.write(("\n".join(batch) + "\n").encode("utf-8"))
+    out.flush()
+
+# Alphabets of the --kind token formats that are plain random strings
+ALPHABETS = {
+    "chars": chars,
+    "hex": "0123456789abcdef",
+    "base32": "abcdefghijklmnopqrstuvwxyz234567",
+    "base62": string.digits + string.ascii_uppercase + string.ascii_lowercase,
+}
+KINDS = list(ALPHABETS) + ["uuid4", "uuid7", "ulid"]
+
+CROCKFORD_BASE32 = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", b"0123456789ABCDEFGHJKMNPQRSTVWXYZ")
+
+# Generated per batch by the token functions
+TOKEN_BATCH = 65536
+
+def token_length(alphabet, bits):
+    """Number of characters of alphabet that carry at least bits bits of randomness."""
+    return math.ceil(bits / math.log2(len(alphabet)))
+
+def uuid4_strings(count):
+    """Yield count random UUIDs (version 4) as strings, from one os.urandom call per batch."""
+    while count > 0:
+        batch = min(count, TOKEN_BATCH)
+        digits = os.urandom(16 * batch).hex()
+        for i in range(0, 32 * batch, 32):
+            h = digits[i:i + 32]
+            # Version 4, and the 10 variant bits over the random ones
+            yield f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89ab'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+        count -= batch
+
+_monotonic_lock = threading.Lock()
+# (unix time in ms, random part) of the last time ordered id made in this process
+_monotonic_last = (-1, 0)
+
+def _monotonic_batch(count, random_bits):
+    """
+    Return a list of count (unix time in ms, random int of random_bits)
+    pairs that strictly increase across the whole process. Within one
+    millisecond the random part of the previous id is incremented instead
+    of drawn again, the monotonic method of the ULID and UUIDv7
+    specifications, so ids are sorted by creation and can't collide in
+    this process.
+
+    The lock is only held while the batch is reserved, so generators that
+    are interleaved or abandoned halfway can't block or reorder others.
+    """
+    global _monotonic_last
+    # A fresh random part leaves the top bit clear, room for 2^(bits-1) increments
+    fresh_bits = random_bits - 1
+    fresh_bytes = (fresh_bits + 7) // 8
+    randomness = os.urandom(fresh_bytes * count)
+    values = []
+    with _monotonic_lock:
+        last_ms, last_random = _monotonic_last
+        for i in range(0, fresh_bytes * count, fresh_bytes):
+            ms = time.time_ns() // 1_000_000
+            if ms > last_ms:
+                last_ms = ms
+                last_random = int.from_bytes(randomness[i:i + fresh_bytes], "big") >> (8 * fresh_bytes - fresh_bits)
+            elif last_random + 1 < 1 << random_bits:
+                last_random += 1
+            else:
+                # The random part ran out: borrow the next millisecond
+                last_ms += 1
+                last_random = int.from_bytes(randomness[i:i + fresh_bytes], "big") >> (8 * fresh_bytes - fresh_bits)
+            values.append((last_ms, last_random))
+        _monotonic_last = (last_ms, last_random)
+    return values
+
+def _monotonic_values(count, random_bits):
+    """Yield count increasing pairs of _monotonic_batch, reserved a batch at a time."""
+    while count > 0:
+        batch = min(count, TOKEN_BATCH)
+        yield from _monotonic_batch(batch, random_bits)
+        count -= batch
+
+def uuid7_strings(count):
+    """Yield count time ordered UUIDs (version 7) as strings, see _monotonic_values."""
+    for ms, rand in _monotonic_values(count, 74):
+        value = ms << 80 | 7 << 76 | (rand >> 62) << 64 | 2 << 62 | rand & ((1 << 62) - 1)
+        h = f"{value:032x}"
+        yield f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def ulid_strings(count):
+    """Yield count ULIDs (26 characters of Crockford's base32), see _monotonic_values."""
+    while count > 0:
+        batch = min(count, TOKEN_BATCH)
+        # Each 128 bit ULID left aligned in 20 bytes: 130 bits are 26 characters,
+        # the rest pads it to whole base32 groups, so one b32encode does the batch
+        records = b"".join(((ms << 80 | rand) << 30).to_bytes(20, "big")
+                           for ms, rand in _monotonic_values(batch, 80))
+        encoded = base64.b32encode(records).translate(CROCKFORD_BASE32).decode("ascii")
+        for i in range(0, 32 * batch, 32):
+            yield encoded[i:i + 26]
+        count -= batch
+
+class UniqueFilter:
+    """
+    Remembers the tokens of a batch in a Bloom filter of bits_per_token
+    bits each, to drop repeats. A repeat is always recognised. A new token
+    is taken for a repeat with a small probability (about 0.25% at 16 bits
+    per token, once full) and is then just replaced by another one, so the
+    batch is guaranteed free of duplicates at 2 bytes per token.
+
+    A token wrongly taken for a repeat stays so, which only matters when
+    the batch is a large part of all possible tokens: tokens() remembers
+    those batches exactly instead.
+    """
+    def __init__(self, capacity, bits_per_token=16, hashes=4):
+        self.size = max(64, capacity * bits_per_token)
+        self.hashes = hashes
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, token):
+        """Remember token; False if it may have been added before."""
+        value = hash(token)
+        step = (value >> 32) | 1
+        new = False
+        bits = self.bits
+        for _ in range(self.hashes):
+            position = value % self.size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+            value += step
+        return new
+
+def tokens(count, kind="chars", length=None, alphabet=None, bits=128, unique=False):
+    """
+    Iterate over count random tokens.
+
+    Args:
+        count: Number of tokens
+        kind: One of KINDS: a random string of the chars, hex, base32 or
+            base62 alphabet, or a uuid4, uuid7 or ulid
+        length: Characters per random string (default: enough for bits)
+        alphabet: Custom alphabet of up to 256 characters, instead of kind
+        bits: Randomness of random strings when length isn't given
+        unique: Guarantee the batch is free of duplicates (uuid7 and ulid
+            always are)
+
+    Raises:
+        ValueError: unique is set and there aren't count different tokens
+    """
+    # Number of different tokens, when small enough to matter
+    possible = None
+    if kind == "uuid4":
+        generate = uuid4_strings
+    elif kind == "uuid7":
+        return uuid7_strings(count)
+    elif kind == "ulid":
+        return ulid_strings(count)
+    else:
+        if alphabet is None:
+            if kind not in ALPHABETS:
+                raise ValueError(f"unknown token kind: {kind}")
+            alphabet = ALPHABETS[kind]
+        if length is None:
+            length = token_length(alphabet, bits)
+        def generate(n):
+            return random_strings(length, alphabet, n)
+        possible = len(set(alphabet)) ** length
+    if not unique:
+        return generate(count)
+    if possible is not None and count > possible:
+        raise ValueError(f"only {possible} different tokens of {length} characters exist, can't make {count}")
+    # When the batch is a large part of the possible tokens the Bloom filter
+    # could end up rejecting all that are left
+    exact = possible is not None and possible <= 64 * count
+    return _unique_tokens(generate, count, exact)
+
+def _unique_tokens(generate, count, exact=False):
+    if exact:
+        seen = set()
+    else:
+        seen = UniqueFilter(count)
+    while count > 0:
+        # Replacements for dropped tokens come from another round
+        dropped = 0
+        for token in generate(count):
+            if exact:
+                new = token not in seen
+                seen.add(token)
+            else:
+                new = seen.add(token)
+            if new:
+                yield token
+            else:
+                dropped += 1
+        count = dropped
+
+def write_tokens(out, token_iterator):
+    """Write tokens to the binary stream out, one per line, a batch per write."""
+    while True:
+        batch = list(itertools.islice(token_iterator, TOKEN_BATCH))
+        if not batch:
+            break
+        out.write(("\n".join(batch) + "\n").encode("utf-8"))
+    out.flush()
+
+# Parallel generation writes chunks of about this many bytes at a time
+CHUNK_BYTES = 4 << 20
+
+def _chunk_strings(str_size):
+    """Strings per chunk, which depends on str_size only so seeded output doesn't depend on the job count."""
+    return max(1, CHUNK_BYTES // (str_size + 1))
+
+def _chunk_bytes(str_size, allowed_chars, count, seed, chunk):
+    """
+    Return the lines of chunk number chunk of count strings, as bytes.
+    Every chunk has its own stream: os.urandom, or when seeded a
+    random.Random seeded with the seed and the chunk number, which is
+    reproducible but not cryptographically secure.
+    """
+    per_chunk = _chunk_strings(str_size)
+    strings = min(per_chunk, count - chunk * per_chunk)
+    if not str_size:
+        return b"\n" * strings
+    randbytes = os.urandom if seed is None else random.Random(f"{seed}/{chunk}").randbytes
+    lines = []
+    for _, block in _random_blocks(str_size, allowed_chars, strings, randbytes):
+        lines.extend([block[i:i + str_size] for i in range(0, len(block), str_size)])
+    lines.append(b"")
+    return b"\n".join(lines)
+
+# (file descriptor, mmap or None) of the file a process of write_random_file writes to
+_output = None
+
+def _open_output(path, use_mmap):
+    global _output
+    fd = os.open(path, os.O_RDWR)
+    _output = (fd, mmap.mmap(fd, 0) if use_mmap else None)
+
+def _close_output():
+    global _output
+    fd, mapped = _output
+    if mapped is not None:
+        mapped.flush()
+        mapped.close()
+    os.close(fd)
+    _output = None
+
+def _write_chunk(task):
+    """Generate a chunk and write it at its offset in the output file, computable as records have a fixed length."""
+    str_size, allowed_chars, count, seed, chunk = task
+    data = _chunk_bytes(str_size, allowed_chars, count, seed, chunk)
+    offset = chunk * _chunk_strings(str_size) * (str_size + 1)
+    fd, mapped = _output
+    if mapped is not None:
+        mapped[offset:offset + len(data)] = data
+    else:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+
+def _chunk_task(task):
+    return _chunk_bytes(*task)
+
+def write_random_file(path, str_size, allowed_chars, count, jobs=None, seed=None, use_mmap=False):
+    """
+    Write count random strings of str_size to the file path, one per line,
+    generated by jobs processes (default: one per CPU).
+
+    The file is preallocated and split in chunks of fixed length records
+    that each process writes at their offset, with os.pwrite or through
+    mmap. With a seed the contents only depend on the seed, str_size,
+    allowed_chars and count, not on jobs.
+    """
+    if not allowed_chars.isascii():
+        raise ValueError("writing to a file in parallel needs an ASCII alphabet")
+    with open(path, "wb") as f:
+        f.truncate(count * (str_size + 1))
+    if not count:
+        return
+    tasks = [(str_size, allowed_chars, count, seed, chunk)
+             for chunk in range(-(-count // _chunk_strings(str_size)))]
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if jobs == 1:
+        _open_output(path, use_mmap)
+        try:
+            for task in tasks:
+                _write_chunk(task)
+        finally:
+            _close_output()
+    else:
+        with multiprocessing.Pool(jobs, _open_output, (path, use_mmap)) as pool:
+            for _ in pool.imap_unordered(_write_chunk, tasks):
+                pass
+            pool.close()
+            pool.join()
+
+def write_random_chunks(out, str_size, allowed_chars, count, jobs=None, seed=None):
+    """Like write_random_file, for the binary stream out: chunks are written in order as they're ready."""
+    if not allowed_chars.isascii():
+        raise ValueError("parallel generation needs an ASCII alphabet")
+    tasks = [(str_size, allowed_chars, count, seed, chunk)
+             for chunk in range(-(-count // _chunk_strings(str_size)))]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    if jobs == 1:
+        for task in tasks:
+            out.write(_chunk_task(task))
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            for data in pool.imap(_chunk_task, tasks):
+                out.write(data)
+    out.flush()
+
+def benchmark(str_size, allowed_chars, count):
+    """Print how many strings per second the per-character and the batched paths make."""
+    def per_char_random():
+        for _ in range(count):
+            ''.join(random.choice(allowed_chars) for x in range(str_size))
+
+    def per_char_secrets():
+        for _ in range(count):
+            random_string_generator(str_size, allowed_chars)
+
+    def batched():
+        for _ in random_strings(str_size, allowed_chars, count):
+            pass
+
+    def batched_write():
+        with open(os.devnull, "wb") as devnull:
+            write_random_strings(devnull, str_size, allowed_chars, count)
+
+    print(f"{count} strings of {str_size} characters:")
+    rates = {}
+    for name, run in (("random.choice per character (insecure)", per_char_random),
+                      ("secrets.choice per character", per_char_secrets),
+                      ("batched os.urandom, strings", batched),
+                      ("batched os.urandom, written out", batched_write)):
+        started = time.perf_counter()
+        run()
+        rates[name] = count / (time.perf_counter() - started)
+        print(f"  {name:<40} {rates[name]:>14,.0f} strings/s")
+    speedup = rates["batched os.urandom, written out"] / rates["random.choice per character (insecure)"]
+    print(f"Batched and written out: {speedup:.1f}x the random.choice path")
+
+def run_tests():
+    """Run some basic tests of the generators."""
+    import collections
+    import subprocess
+    import tempfile
+    print("Running tests...\n")
+    
+    all_tests_passed = True
+    
+    def check(description, ok):
+        nonlocal all_tests_passed, passed
+        if ok:
+            print(f"  ✓ {description}")
+        else:
+            print(f"  ERROR: {description}")
+            passed = all_tests_passed = False
+    
+    def report(number):
+        print(f"\nTEST {number}: {'PASSED' if passed else 'FAILED'}")
+    
+    # Test 1: Rejection sampling
+    print("TEST 1: Every character of an alphabet is equally likely")
+    print("--------------------------------------------------------")
+    passed = True
+    # 256 isn't a multiple of 67: modulo mapping would favour the first 55 characters by a third
+    per_character = 30000
+    counts = collections.Counter("".join(random_strings(len(chars), chars, per_character)))
+    print(f"  {len(chars)} characters drawn {per_character} times each on average: "
+          f"min {min(counts.values())}, max {max(counts.values())}")
+    check("every character within 5% of the expected count",
+          len(counts) == len(chars) and all(abs(n - per_character) < per_character // 20 for n in counts.values()))
+    greek = "αβγδε"
+    counts = collections.Counter("".join(random_strings(10, greek, 10000)))
+    check("a non-ASCII alphabet maps to its own characters", set(counts) == set(greek))
+    report(1)
+    
+    # Test 2: Seeded parallel output
+    print("\n\nTEST 2: Seeded output doesn't depend on the number of jobs")
+    print("---------------------------------------------------------")
+    passed = True
+    test_dir = tempfile.mkdtemp(prefix="rstring_test_")
+    try:
+        # Several chunks of 100 character strings
+        count = 3 * _chunk_strings(100) + 7
+        outputs = []
+        for jobs, use_mmap in ((1, False), (2, False), (3, True)):
+            path = os.path.join(test_dir, f"{jobs}.txt")
+            write_random_file(path, 100, chars, count, jobs, seed="test", use_mmap=use_mmap)
+            with open(path, "rb") as f:
+                outputs.append(f.read())
+        with open(os.path.join(test_dir, "stream.txt"), "wb") as f:
+            write_random_chunks(f, 100, chars, count, 2, seed="test")
+        with open(os.path.join(test_dir, "stream.txt"), "rb") as f:
+            outputs.append(f.read())
+        check(f"{count} strings: 1 and 2 jobs, mmap with 3 and a stream are identical",
+              all(output == outputs[0] for output in outputs))
+        check("every line has 100 characters of the alphabet",
+              all(len(line) == 100 and set(line) <= set(chars.encode()) for line in outputs[0].splitlines())
+              and outputs[0].count(b"\n") == count)
+    finally:
+        shutil.rmtree(test_dir)
+    report(2)
+    
+    # Test 3: UUID bit layouts, checked by the uuid module
+    print("\n\nTEST 3: UUIDv4 and UUIDv7 versions, variants and timestamps")
+    print("-----------------------------------------------------------")
+    passed = True
+    now_ms = time.time_ns() // 1_000_000
+    v4 = [uuid.UUID(value) for value in tokens(1000, "uuid4")]
+    check("uuid4 has version 4 and the RFC 4122 variant",
+          all(value.version == 4 and value.variant == uuid.RFC_4122 for value in v4))
+    # Two interleaved generators share the monotonic state, each reserving its batch
+    first, second = zip(*zip(tokens(1000, "uuid7"), tokens(1000, "uuid7")))
+    v7 = [uuid.UUID(value) for value in first + second]
+    check("uuid7 has version 7 and the RFC 4122 variant",
+          all(value.version == 7 and value.variant == uuid.RFC_4122 for value in v7))
+    check("uuid7 holds the current unix time in ms", all(abs((value.int >> 80) - now_ms) < 5000 for value in v7))
+    check("interleaved uuid7 strictly increase, the later batch after the first",
+          all(a.int < b.int for a, b in zip(v7, v7[1:])))
+    report(3)
+    
+    # Test 4: ULIDs
+    print("\n\nTEST 4: ULIDs are 26 Crockford base32 characters, sorted by creation")
+    print("-------------------------------------------------------------------")
+    passed = True
+    crockford = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    first, second = zip(*zip(tokens(1000, "ulid"), tokens(1000, "ulid")))
+    ulids = list(first + second)
+    check("26 characters of Crockford's alphabet, the first at most 7",
+          all(len(value) == 26 and set(value) <= set(crockford) and value[0] <= "7" for value in ulids))
+    def decode(value):
+        number = 0
+        for character in value:
+            number = number * 32 + crockford.index(character)
+        return number
+    check("holds the current unix time in ms", all(abs((decode(value) >> 80) - now_ms) < 5000 for value in ulids))
+    check("interleaved ulids strictly increase, the later batch after the first", all(a < b for a, b in zip(ulids, ulids[1:])))
+    report(4)
+    
+    # Test 5: --unique
+    print("\n\nTEST 5: Unique batches have no duplicates")
+    print("-----------------------------------------")
+    passed = True
+    every = list(tokens(256, "hex", 2, unique=True))
+    check("all 256 two character hex strings, each once (exact filter)", len(set(every)) == len(every) == 256)
+    bloom = list(tokens(50000, "chars", 4, unique=True))
+    check("50000 four character strings out of 20M, no duplicates (Bloom filter)",
+          len(set(bloom)) == len(bloom) == 50000)
+    try:
+        tokens(257, "hex", 2, unique=True)
+        check("more than the possible tokens raises ValueError", False)
+    except ValueError:
+        check("more than the possible tokens raises ValueError", True)
+    report(5)
+    
+    # Test 6: --bits
+    print("\n\nTEST 6: --bits picks the length of random strings")
+    print("------------------------------------------------")
+    passed = True
+    for argv, length in ((["--bits", "64"], 11),
+                         (["--bits", "64", "-c", "3"], 11),
+                         (["-a", "01", "--bits", "20", "-c", "3"], 20),
+                         (["-k", "hex", "--bits", "64"], 16)):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), *argv], capture_output=True)
+        lines = result.stdout.splitlines()
+        check(f"{' '.join(argv)}: strings of {length} characters",
+              result.returncode == 0 and lines and all(len(line) == length for line in lines))
+    report(6)
+    
+    # Summary
+    print("\n======================")
+    if all_tests_passed:
+        print("All tests PASSED!")
+    else:
+        print("Some tests FAILED!")
+    print("======================")
+    
+    return all_tests_passed
+
+USAGE = 'rstring.py -s <stringsize> [-c <count>] [-k <kind> | -a <alphabet>] [-u] [-o <file>] [-j <jobs>] [--seed <seed>] [-b] | --guid | --test'
+
 def main(argv):
-    size = 12
-    generate_guid = False
+    size = None
+    count = None
+    kind = "chars"
+    alphabet = None
+    bits = None
+    unique = False
+    out = None
+    jobs = None
+    seed = None
+    use_mmap = False
+    run_benchmark = False
     
     try:
-        opts, args = getopt.getopt(argv,"hs:g",["size=","guid"])
+        opts, args = getopt.getopt(argv,"hs:c:k:a:uo:j:bg",["size=","count=","kind=","alphabet=","bits=","unique","out=","jobs=","seed=","mmap","benchmark","guid","test"])
     except getopt.GetoptError:
-        print('rstring.py -s <stringsize> | --guid')
+        print(USAGE)
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('rstring.py -s <stringsize> | --guid')
+            print(USAGE)
+            print('  -c, --count N       print N strings, one per line')
+            print(f'  -k, --kind KIND     one of {", ".join(KINDS)} (default: chars)')
+            print('  -a, --alphabet ABC  random strings of the characters ABC')
+            print('      --bits N        randomness of a string when -s is not given (default: 128)')
+            print('  -u, --unique        guarantee the strings are free of duplicates')
+            print('  -o, --out FILE      write to FILE instead of stdout')
+            print('  -j, --jobs K        generate random strings with K processes (default: one per CPU with --out)')
+            print('      --seed SEED     reproducible (not secure) random strings, the same for any -j')
+            print('      --mmap          write --out through a memory mapped file')
+            print('  -b, --benchmark     compare the per-character and batched generators')
+            print('  -g, --guid          same as --kind uuid4')
+            print('      --test          run the built-in tests')
             sys.exit()
         elif opt in ("-s", "--size"):
             size = arg
+        elif opt in ("-c", "--count"):
+            count = arg
+        elif opt in ("-k", "--kind"):
+            kind = arg
+        elif opt in ("-a", "--alphabet"):
+            alphabet = arg
+        elif opt == "--bits":
+            bits = arg
+        elif opt in ("-u", "--unique"):
+            unique = True
+        elif opt in ("-o", "--out"):
+            out = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = arg
+        elif opt == "--seed":
+            seed = arg
+        elif opt == "--mmap":
+            use_mmap = True
+        elif opt in ("-b", "--benchmark"):
+            run_benchmark = True
+        elif opt == "--test":
+            sys.exit(0 if run_tests() else 1)
         elif opt in ("-g", "--guid"):
-            generate_guid = True
+            kind = "uuid4"
+    
+    try:
+        size = int(size) if size is not None else None
+        count = int(count) if count is not None else None
+        bits = int(bits) if bits is not None else None
+        jobs = int(jobs) if jobs is not None else None
+        if (size is not None and size < 0) or (count is not None and count < 0) or \
+                (bits is not None and bits <= 0) or (jobs is not None and jobs <= 0):
+            raise ValueError
+    except ValueError:
+        print('size and count must be non-negative integers, bits and jobs positive ones')
+        sys.exit(2)
+    if kind not in KINDS:
+        print(f'kind must be one of {", ".join(KINDS)}')
+        sys.exit(2)
+    if alphabet is not None and not 0 < len(alphabet) <= 256:
+        print('the alphabet must have between 1 and 256 characters')
+        sys.exit(2)
+    if size is None and bits is None and kind == "chars" and alphabet is None:
+        size = 12
+    elif size is None and bits is not None and (alphabet is not None or kind in ALPHABETS):
+        size = token_length(alphabet or ALPHABETS[kind], bits)
+    parallel = jobs is not None or seed is not None or use_mmap
+    if parallel:
+        if unique or (alphabet is None and kind not in ALPHABETS) or not (alphabet or "").isascii():
+            print('-j, --seed and --mmap need random strings of an ASCII alphabet, without -u')
+            sys.exit(2)
+        if use_mmap and out is None:
+            print('--mmap needs --out')
+            sys.exit(2)
     
-    if generate_guid:
-        print(str(uuid.uuid4()))
+    if run_benchmark:
+        benchmark(size if size is not None else 12, alphabet or ALPHABETS.get(kind, chars),
+                  count if count is not None else 100000)
+    elif parallel or out is not None and kind in ALPHABETS and not unique and (alphabet or "").isascii():
+        alphabet = alphabet or ALPHABETS[kind]
+        if size is None:
+            size = token_length(alphabet, bits if bits is not None else 128)
+        count = count if count is not None else 1
+        if out is not None:
+            write_random_file(out, size, alphabet, count, jobs, seed, use_mmap)
+        else:
+            write_random_chunks(sys.stdout.buffer, size, alphabet, count, jobs, seed)
+    elif out is not None:
+        try:
+            token_iterator = tokens(count if count is not None else 1, kind, size, alphabet,
+                                    bits if bits is not None else 128, unique)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+        with open(out, "wb") as f:
+            write_tokens(f, token_iterator)
+    elif kind == "chars" and alphabet is None and not unique:
+        if count is not None:
+            write_random_strings(sys.stdout.buffer, size, chars, count)
+        else:
+            print(next(random_strings(size, chars, 1)))
     else:
-        print(random_string_generator(int(size), chars))
-
+        try:
+            token_iterator = tokens(count if count is not None else 1, kind, size, alphabet,
+                                    bits if bits is not None else 128, unique)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+        write_tokens(sys.stdout.buffer, token_iterator)
 
 if __name__ == "__main__":
    main(sys.argv[1:])
\ No newline at end of file